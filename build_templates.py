@@ -0,0 +1,23 @@
+import logging
+import sys
+
+from src.logger_setup import setup_logging
+from src.template_loader import precompile_templates
+
+setup_logging()
+
+def main():
+    """
+    Precompiles the Jinja2 email templates into importable modules.
+    Run after deploying or editing templates; stale modules are ignored until rebuilt.
+    """
+    logging.info("--- Starting Template Precompilation ---")
+    try:
+        precompile_templates()
+        logging.info("Template precompilation finished successfully.")
+    except Exception as e:
+        logging.critical(f"A critical error occurred while precompiling templates: {e}", exc_info=True)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
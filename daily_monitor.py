@@ -1,5 +1,6 @@
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from src.config import settings
 from src.data_manager import DataManager
@@ -16,6 +17,33 @@ from src.scenarios import (
 
 setup_logging()
 
+# (result key, label, monitor) for each daily check, in the order they run sequentially.
+MONITORS = [
+    ('branch_signouts', "Branch Sign-out Monitoring", _monitor_branch_signouts),
+    ('branch_auths', "Branch Financial Authorization Monitoring", _monitor_branch_authorizations),
+    # ('ho_auths', "Head Office Financial Authorization Monitoring", _monitor_head_office_authorizations),
+    ('teller_signouts', "Teller Sign-out Monitoring", _monitor_teller_signouts),
+    ('common_auths', "Common Authorization Queue Monitoring", _monitor_common_authorizations),
+]
+
+def _run_monitor(label, monitor, data_manager, email_service):
+    logging.info(f"--- Running: {label} ---")
+    return monitor(data_manager, email_service)
+
+def _run_monitors(data_manager, email_service):
+    """
+    Runs every monitor and returns their results by key.
+    In CONCURRENT mode the monitors share a bounded thread pool, so the run takes about as long as the
+    slowest monitor; this returns only once all of them have finished.
+    """
+    if settings.MONITOR_RUN_MODE != "CONCURRENT":
+        return {key: _run_monitor(label, monitor, data_manager, email_service) for key, label, monitor in MONITORS}
+
+    logging.info(f"Running {len(MONITORS)} monitors concurrently on {settings.MONITOR_WORKERS} workers.")
+    with ThreadPoolExecutor(max_workers=settings.MONITOR_WORKERS, thread_name_prefix="monitor") as executor:
+        futures = {key: executor.submit(_run_monitor, label, monitor, data_manager, email_service) for key, label, monitor in MONITORS}
+        return {key: future.result() for key, future in futures.items()}
+
 def main():
     """
     Entry point for the Daily EOD Monitoring script.
@@ -24,42 +52,52 @@ def main():
     """
     logging.info("--- Starting Daily EOD Monitoring Script ---")
     logging.info(f"Email mode: {settings.EMAIL_MODE}")
+    logging.info(f"Monitor run mode: {settings.MONITOR_RUN_MODE}")
 
+    data_manager = email_service = None
     try:
         data_manager = DataManager()
-        email_service = EmailService()
-        
-        # This dictionary will hold all the data found during the run.
-        report_context = {}
+        # Notifications are logged by the email service only once their alert is delivered.
+        email_service = EmailService(outbox=data_manager.get_outbox("daily_monitor"), on_delivered=data_manager.log_notification)
+
+        # Load all branch configs in one query; every monitor and the report share this directory.
+        data_manager.get_branch_directory()
         
         # --- Step 1: Run each check. They will send their own targeted alerts. ---
         # --- Each function will also return the data it found for the summary. ---
-        
-        logging.info("--- Running: Branch Sign-out Monitoring ---")
-        report_context['branch_signouts'] = _monitor_branch_signouts(data_manager, email_service)
-        
-        logging.info("--- Running: Branch Financial Authorization Monitoring ---")
-        report_context['branch_auths'] = _monitor_branch_authorizations(data_manager, email_service)
-        
-        # logging.info("--- Running: Head Office Financial Authorization Monitoring ---")
-        # report_context['ho_auths'] = _monitor_head_office_authorizations(data_manager, email_service)
-        
-        logging.info("--- Running: Teller Sign-out Monitoring ---")
-        report_context['teller_signouts'] = _monitor_teller_signouts(data_manager, email_service)
-        
-        logging.info("--- Running: Common Authorization Queue Monitoring ---")
-        branch_common_auths, ho_common_auths = _monitor_common_authorizations(data_manager, email_service)
+        # With ORACLE_QUEUE_SNAPSHOT every monitor reads the queues from one read-only transaction.
+        with data_manager.queue_snapshot():
+            results = _run_monitors(data_manager, email_service)
+        data_manager.flush_notifications()
+
+        # This dictionary will hold all the data found during the run.
+        report_context = {
+            'branch_signouts': results['branch_signouts'],
+            # 'ho_auths': results['ho_auths'],
+            'branch_auths': results['branch_auths'],
+            'teller_signouts': results['teller_signouts'],
+        }
+        branch_common_auths, ho_common_auths = results['common_auths']
         report_context['branch_common_auths'] = branch_common_auths
         # report_context['ho_common_auths'] = ho_common_auths
         
         # --- Step 2: Send the final consolidated report to management. ---
         _send_all_consolidated_reports(data_manager, email_service, report_context)
 
+        data_manager.log_query_stats()
+
+        # Wait for every queued alert and report to be delivered before exiting.
+        email_service.flush()
+        data_manager.flush_notifications()
+
         logging.info("Daily monitoring script finished successfully.")
 
     except Exception as e:
         logging.critical(f"A critical error occurred during the daily monitoring run: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        if email_service: email_service.close()
+        if data_manager: data_manager.flush_notifications()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
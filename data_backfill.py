@@ -0,0 +1,36 @@
+import argparse
+import logging
+import sys
+
+from src.data_manager import DataManager
+from src.logger_setup import setup_logging
+
+setup_logging()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill group names on eodDelayLogs and rebuild eodDelayDailyRollup.")
+    parser.add_argument("--all", action="store_true", help="Wipe and rebuild the whole rollup, losing history for purged periods.")
+    return parser.parse_args()
+
+def main():
+    """
+    One-off backfill of the derived MongoDB collections used for reporting.
+    Stores the resolved group name on older eodDelayLogs documents, then rebuilds eodDelayDailyRollup
+    for the days still covered by raw eodDelayLogs; rollup days for archived and purged periods are kept.
+    Run it once after deploying the rollup, or after a rollup write failure. --all rebuilds everything
+    from the remaining raw logs and discards the rollup history of purged periods.
+    """
+    args = parse_args()
+    logging.info("--- Starting Reporting Data Backfill ---")
+    try:
+        # MongoDB only: no Oracle pool, and no plan check since the backfill scans eodDelayLogs in full anyway.
+        data_manager = DataManager(oracle=False, verify_query_plans=False)
+        data_manager.backfill_group_names()
+        data_manager.rebuild_daily_rollup(all_days=args.all)
+        logging.info("Reporting data backfill finished successfully.")
+    except Exception as e:
+        logging.critical(f"A critical error occurred during the reporting data backfill: {e}", exc_info=True)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
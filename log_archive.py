@@ -0,0 +1,74 @@
+import argparse
+import logging
+import os
+import re
+import sys
+from pathlib import Path
+
+from pymongo import MongoClient
+
+from src.config import settings
+from src.log_archive import branch_line_pattern, list_days, read_day
+
+# Console-only logging: this tool reads old logs and should not append to today's log file.
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Read one day's EOD log straight from the live log directory or the monthly log archives.")
+    parser.add_argument("--log-dir", default=settings.LOG_DIR, help="Directory holding the daily logs and archives (default: LOG_DIR).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="List the days (and script runs) that can be read.")
+    list_parser.add_argument("--month", help="Only days in this month, e.g. 2025-09.")
+
+    for name, help_text in (("show", "Print one day's log."), ("grep", "Print the lines of one day's log matching a regex."), ("branch", "Print one branch's lines from one day's log.")):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument("date", help="Day to read, e.g. 2025-09-15.")
+        if name == "grep": sub.add_argument("pattern", help="Regular expression (case-insensitive).")
+        if name == "branch":
+            sub.add_argument("branch_code", type=int, help="Branch code, e.g. 12.")
+            sub.add_argument("--name", help="Branch name, to also match email subjects (default: looked up in MongoDB).")
+        sub.add_argument("--run", type=int, help="Only the Nth script run of that day (see 'list').")
+    return parser.parse_args()
+
+def lookup_branch_name(branch_code: int):
+    """The branch's name from the branches collection, or None if MongoDB is not configured or not reachable."""
+    if not settings.MONGO_URI: return None
+    try:
+        with MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=3000) as client:
+            branch = client.get_default_database().branches.find_one({"_id": branch_code}, {"name": 1})
+        return branch.get("name") if branch else None
+    except Exception as e:
+        logging.warning(f"Could not look up the name of branch {branch_code} ({e}); matching on the branch code only.")
+        return None
+
+def main():
+    """Entry point for the log archive reader."""
+    args = parse_args()
+    try:
+        if args.command == "list":
+            for day, source, runs in list_days(Path(args.log_dir)):
+                if args.month and not day.startswith(args.month): continue
+                print(f"{day}  {source}")
+                for number, run in enumerate(runs, 1): print(f"    run {number}: {run['started']}  {run['script']}")
+            return
+
+        pattern = None
+        if args.command == "grep": pattern = re.compile(args.pattern, re.IGNORECASE)
+        if args.command == "branch": pattern = branch_line_pattern(args.branch_code, args.name or lookup_branch_name(args.branch_code))
+        for line in read_day(Path(args.log_dir), args.date, args.run):
+            if pattern is None or pattern.search(line): print(line)
+
+    except BrokenPipeError:
+        # The reader (e.g. `| head`) has exited; point stdout at devnull so the final flush does not fail too.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    except (FileNotFoundError, ValueError) as e:
+        logging.error(e)
+        sys.exit(1)
+    except Exception as e:
+        logging.critical(f"A critical error occurred while reading the log archive: {e}", exc_info=True)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
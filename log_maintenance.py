@@ -1,20 +1,21 @@
 import logging
-import shutil
-import subprocess
-from datetime import datetime
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from pathlib import Path
-from zipfile import ZipFile
 
 from dateutil.relativedelta import relativedelta
+from bson import ObjectId
 from pymongo import MongoClient
 
 from src.config import settings
+from src.data_manager import EXPIRE_AT_TTL_INDEX, assert_index_scan
+from src.log_archive import compress_files, describe_compression, resolve_codec
+from src.mongo_archive import archive_suffix, export_collection, exported_range, purge_exported, verify_archive
 from src.logger_setup import setup_logging
 
 # --- PREREQUISITE: pip install python-dateutil ---
 
-setup_logging()
-
 def get_target_period_range():
     """Calculates the start and end datetime for the 6-month period that ended 6 months ago."""
     today = datetime.utcnow()
@@ -27,86 +28,139 @@ def get_target_period_range():
     return start_of_target_period, end_of_target_period
 
 def compress_log_files(start_date: datetime, end_date: datetime, log_dir: Path):
-    """Finds, compresses, and deletes log files for the target 6-month period."""
-    # --- MODIFICATION: New archive name format ---
-    archive_name = f"{datetime.now().strftime('%Y%m%d')}_logs_archive_{start_date.strftime('%Y%m')}_to_{end_date.strftime('%Y%m')}.zip"
-    archive_path = log_dir / archive_name
-
-    log_files_to_compress = []
+    """Finds, compresses, and deletes log files for the target 6-month period, one archive per month compressed in parallel."""
+    files_by_month = {}
     current_month = start_date
     while current_month <= end_date:
         # --- MODIFICATION: New pattern to find date-prefixed log files ---
         log_pattern = f"{current_month.strftime('%Y%m')}*_eod_monitor.log"
-        log_files_to_compress.extend(log_dir.glob(log_pattern))
+        month_files = sorted(log_dir.glob(log_pattern))
+        if month_files: files_by_month[current_month.strftime('%Y%m')] = month_files
         current_month += relativedelta(months=1)
 
-    if not log_files_to_compress:
+    if not files_by_month:
         logging.info(f"No log files found for the period {start_date.strftime('%B %Y')} to {end_date.strftime('%B %Y')}. Nothing to compress.")
         return
 
-    logging.info(f"Found {len(log_files_to_compress)} log files for the target period.")
-    
-    try:
-        with ZipFile(archive_path, 'w') as zipf:
-            for file in log_files_to_compress:
-                zipf.write(file, arcname=file.name)
-        logging.info(f"Successfully created log archive: {archive_path}")
-
-        for file in log_files_to_compress:
-            file.unlink()
-        logging.info("Deleted original log files after successful compression.")
-    except Exception as e:
-        logging.error(f"Failed to compress log files: {e}", exc_info=True)
-        if archive_path.exists(): archive_path.unlink()
-        logging.warning("Log compression failed. Original files have NOT been deleted.")
+    codec, compression = resolve_codec()
+    workers = max(1, min(settings.LOG_ARCHIVE_WORKERS, len(files_by_month)))
+    logging.info(f"Found {sum(len(files) for files in files_by_month.values())} log files in {len(files_by_month)} month(s). Compressing with {codec} on {workers} process(es)...")
+
+    started = time.perf_counter()
+    total_raw = total_compressed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for month, files in files_by_month.items():
+            # --- MODIFICATION: New archive name format ---
+            archive_path = log_dir / f"{datetime.now().strftime('%Y%m%d')}_logs_archive_{month}.zip"
+            futures[pool.submit(compress_files, str(archive_path), [str(file) for file in files], compression, settings.LOG_ARCHIVE_LEVEL)] = month
+        for future in as_completed(futures):
+            month, files = futures[future], files_by_month[futures[future]]
+            try:
+                archive_path, raw_bytes, compressed_bytes, seconds = future.result()
+            except Exception as e:
+                logging.error(f"Failed to compress log files for {month}: {e}", exc_info=True)
+                logging.warning(f"Log compression failed for {month}. Original files have NOT been deleted.")
+                continue
+            logging.info(f"Successfully created log archive: {archive_path} - {describe_compression(raw_bytes, compressed_bytes, seconds)}")
+            for file in files:
+                file.unlink()
+            total_raw += raw_bytes
+            total_compressed += compressed_bytes
+    if total_raw:
+        logging.info(f"Deleted original log files after successful compression. Overall: {describe_compression(total_raw, total_compressed, time.perf_counter() - started)}")
 
 def archive_and_purge_mongodb(start: datetime, end: datetime, archive_dir: Path):
     """Exports and deletes documents from the eodDelayLogs collection for the target period."""
-    if not shutil.which("mongodump"):
-        logging.critical("'mongodump' command not found in system PATH. Cannot perform MongoDB archive.")
-        return
-
     # --- MODIFICATION: New archive name format ---
-    archive_file_name = f"{datetime.now().strftime('%Y%m%d')}_eodDelayLogs_archive_{start.strftime('%Y%m')}_to_{end.strftime('%Y%m')}.gz"
+    archive_file_name = f"{datetime.now().strftime('%Y%m%d')}_eodDelayLogs_archive_{start.strftime('%Y%m')}_to_{end.strftime('%Y%m')}{archive_suffix()}"
     archive_file = archive_dir / archive_file_name
-    
-    query = f"{{'timestamp': {{'$gte': ISODate('{start.isoformat()}Z'), '$lte': ISODate('{end.isoformat()}Z')}}}}"
-    command = [
-        "mongodump", "--uri", settings.MONGO_URI, "--collection", "eodDelayLogs",
-        "--query", query, f"--archive={archive_file}", "--gzip"
-    ]
-    
+    query = {"timestamp": {"$gte": start, "$lte": end}}
+
     logging.info(f"Archiving MongoDB logs for period: {start.strftime('%B %Y')} to {end.strftime('%B %Y')}...")
-    
+
+    client = MongoClient(settings.MONGO_URI)
     try:
-        subprocess.run(command, check=True, capture_output=True, text=True)
+        logs = client.get_default_database().eodDelayLogs
+        assert_index_scan(logs, query)
+        manifest = verify_archive(export_collection(logs, query, archive_file))
         logging.info(f"Successfully created MongoDB archive: {archive_file}")
-        
+
         logging.info(f"Purging MongoDB logs for the same period from the live collection...")
-        client = MongoClient(settings.MONGO_URI)
-        db = client.get_default_database()
-        
-        delete_result = db.eodDelayLogs.delete_many({"timestamp": {"$gte": start, "$lte": end}})
-        logging.info(f"Successfully deleted {delete_result.deleted_count} documents from MongoDB.")
+        deleted = purge_exported(logs, query, manifest)
+        logging.info(f"Successfully deleted {deleted} documents from MongoDB.")
+    except Exception as e:
+        logging.error(f"An error occurred during MongoDB archive/purge: {e}", exc_info=True)
+        logging.warning("MongoDB data was NOT purged past the last completed chunk.")
+    finally:
         client.close()
 
-    except subprocess.CalledProcessError as e:
-        logging.error("mongodump command failed. MongoDB data has NOT been deleted.")
-        logging.error(f"Stderr: {e.stderr}")
-        if archive_file.exists(): archive_file.unlink()
+def get_nightly_cutoff():
+    """Documents logged before the start of today (UTC) are exported by the nightly run."""
+    return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+def stamp_expiry(collection, query: dict) -> int:
+    """Sets expireAt = timestamp + LOG_RETENTION_DAYS on every document matching `query`, in _id batches."""
+    set_expiry = [{"$set": {"expireAt": {"$add": ["$timestamp", settings.LOG_RETENTION_DAYS * 24 * 3600 * 1000]}}}]
+    stamped = 0
+    while True:
+        ids = [doc["_id"] for doc in collection.find(query, {"_id": 1}).sort("_id", 1).limit(settings.MAINTENANCE_BATCH_SIZE)]
+        if not ids: return stamped
+        stamped += collection.update_many({"_id": {"$in": ids}, "expireAt": None}, set_expiry).modified_count
+
+def archive_and_expire_mongodb(end: datetime, archive_dir: Path):
+    """
+    NIGHTLY alternative to archive_and_purge_mongodb: exports the eodDelayLogs documents logged before `end` that have not
+    been exported yet, then gives each one an expireAt so the TTL index deletes it once retention has passed.
+    Only documents covered by a verified export are stamped. Anything inserted while the export runs (including late
+    outbox deliveries with an older timestamp) has no expireAt yet and is exported the next night.
+    """
+    # The _id bound pins the export to documents that were already inserted when this run started.
+    query = {"timestamp": {"$lt": end}, "expireAt": None, "_id": {"$lt": ObjectId.from_datetime(datetime.utcnow() - timedelta(minutes=5))}}
+    archive_file = archive_dir / f"{datetime.now().strftime('%Y%m%d')}_eodDelayLogs_nightly_before_{end.strftime('%Y%m%d')}{archive_suffix()}"
+
+    client = MongoClient(settings.MONGO_URI)
+    try:
+        logs = client.get_default_database().eodDelayLogs
+        keys, options = EXPIRE_AT_TTL_INDEX
+        logs.create_index(keys, **options)
+        assert_index_scan(logs, query)
+        pending = logs.count_documents(query)
+        if not pending:
+            logging.info(f"No unexported MongoDB logs before {end.strftime('%Y-%m-%d')}. Nothing to archive.")
+            return
+
+        logging.info(f"Archiving {pending} MongoDB logs recorded before {end.strftime('%Y-%m-%d')}...")
+        manifest = verify_archive(export_collection(logs, query, archive_file))
+        logging.info(f"Successfully created MongoDB archive: {archive_file}")
+
+        stamped = stamp_expiry(logs, exported_range(query, manifest))
+        logging.info(f"Set expireAt on {stamped} exported documents; the TTL index removes them after {settings.LOG_RETENTION_DAYS} days.")
     except Exception as e:
-        logging.error(f"An error occurred during MongoDB archive/purge: {e}", exc_info=True)
-        logging.warning("MongoDB data has NOT been deleted.")
+        logging.error(f"An error occurred during MongoDB archive/expiry: {e}", exc_info=True)
+        logging.warning("Documents without expireAt have NOT been marked for expiry and will be exported again next night.")
+    finally:
+        client.close()
 
 def main():
     """Main entry point for the maintenance script."""
-    logging.info("--- Starting Bi-Annual Log Maintenance Script ---")
     log_dir = Path(settings.LOG_DIR)
     start_date, end_date = get_target_period_range()
+    if settings.MAINTENANCE_MODE == "NIGHTLY":
+        logging.info("--- Starting Nightly Log Maintenance Script ---")
+        # Log files are still archived per six-month period; once compressed this is a no-op until the next period.
+        compress_log_files(start_date, end_date, log_dir)
+        archive_and_expire_mongodb(get_nightly_cutoff(), log_dir)
+        logging.info("--- Nightly Log Maintenance Script Finished ---")
+        return
+    logging.info("--- Starting Bi-Annual Log Maintenance Script ---")
     logging.info(f"Targeting maintenance for period: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
     compress_log_files(start_date, end_date, log_dir)
     archive_and_purge_mongodb(start_date, end_date, log_dir)
     logging.info("--- Bi-Annual Log Maintenance Script Finished ---")
 
 if __name__ == "__main__":
+    # Configured here rather than at import: under the spawn start method every compression worker
+    # re-imports this script as __mp_main__ and must not open the day's log file handlers again.
+    setup_logging()
     main()
\ No newline at end of file
@@ -3,6 +3,14 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _parse_fetch_sizes(value: str) -> dict:
+    sizes = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        name, _, size = entry.partition("=")
+        arraysize, _, prefetchrows = size.partition(":")
+        sizes[name.strip()] = (int(arraysize), int(prefetchrows or arraysize))
+    return sizes
+
 class Settings:
     """
     Centralized configuration class. Loads all settings from environment variables.
@@ -10,14 +18,50 @@ class Settings:
     # --- System Mode ---
     EMAIL_MODE = os.getenv("EMAIL_MODE", "LOG")
     LOG_DIR = os.getenv("LOG_DIR") or "./logs"
+    # Jinja2 bytecode cache and precompiled template modules (see build_templates.py).
+    TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR") or "./.template_cache"
+    # MONITOR_RUN_MODE: SEQUENTIAL (one monitor after another) or CONCURRENT (bounded thread pool)
+    MONITOR_RUN_MODE = os.getenv("MONITOR_RUN_MODE", "SEQUENTIAL").upper()
+    MONITOR_WORKERS = int(os.getenv("MONITOR_WORKERS", 4))
 
     # --- Oracle DB Credentials ---
     ORACLE_USER = os.getenv("ORACLE_USER")
     ORACLE_PASSWORD = os.getenv("ORACLE_PASSWORD")
     ORACLE_DSN = os.getenv("ORACLE_DSN")
+    # In CONCURRENT mode the pool defaults to one connection per monitor worker, so no monitor waits on it;
+    # SEQUENTIAL runs keep the original max of 2.
+    ORACLE_POOL_MIN = int(os.getenv("ORACLE_POOL_MIN", 1))
+    ORACLE_POOL_MAX = int(os.getenv("ORACLE_POOL_MAX", MONITOR_WORKERS if MONITOR_RUN_MODE == "CONCURRENT" else 2))
+    # Statements kept parsed per pooled connection; the default leaves headroom above the size of QUERY_CATALOG.
+    ORACLE_STMT_CACHE_SIZE = int(os.getenv("ORACLE_STMT_CACHE_SIZE", 20))
+    # When true, log cumulative V$SQL parse/execute counts for the catalog (needs SELECT on V$SQL).
+    ORACLE_REPORT_PARSE_STATS = os.getenv("ORACLE_REPORT_PARSE_STATS", "false").lower() == "true"
+    # When true, the daily monitors read every queue on one connection inside a READ ONLY transaction.
+    ORACLE_QUEUE_SNAPSHOT = os.getenv("ORACLE_QUEUE_SNAPSHOT", "false").lower() == "true"
+    # Per-query fetch size overrides for QUERY_FETCH_SIZES, as "name=arraysize[:prefetchrows],...",
+    # e.g. "head_office_authorizations=5000:5000,pending_signouts=50".
+    ORACLE_FETCH_SIZES = _parse_fetch_sizes(os.getenv("ORACLE_FETCH_SIZES", ""))
+    # ORACLE_FETCH_MODE: ROWS (default) or COLUMNAR (Arrow fetch and group_by totals for the authorization alerts; needs pyarrow)
+    ORACLE_FETCH_MODE = os.getenv("ORACLE_FETCH_MODE", "ROWS").upper()
 
     # --- MongoDB Credentials ---
     MONGO_URI = os.getenv("MONGO_URI")
+    # Notification log entries are buffered and bulk-written at stage boundaries, or once this many are pending.
+    NOTIFICATION_LOG_BATCH_SIZE = int(os.getenv("NOTIFICATION_LOG_BATCH_SIZE", 500))
+    # Write concern for eodDelayLogs bulk writes: w is a node count or "majority"; j waits for the journal.
+    _log_w = os.getenv("MONGO_LOG_WRITE_CONCERN", "1")
+    MONGO_LOG_WRITE_CONCERN = int(_log_w) if _log_w.isdigit() else _log_w
+    MONGO_LOG_JOURNAL = os.getenv("MONGO_LOG_JOURNAL", "false").lower() == "true"
+    # Check at startup that eodDelayLogs timestamp queries use an index, and fail if they would COLLSCAN.
+    MONGO_VERIFY_QUERY_PLANS = os.getenv("MONGO_VERIFY_QUERY_PLANS", "true").lower() == "true"
+    # WEEKLY_STATS_CACHE: MONGO (weeklyDelayStats collection), DISK (JSON files in WEEKLY_STATS_CACHE_DIR) or NONE
+    WEEKLY_STATS_CACHE = os.getenv("WEEKLY_STATS_CACHE", "MONGO").upper()
+    WEEKLY_STATS_CACHE_DIR = os.getenv("WEEKLY_STATS_CACHE_DIR") or "./weekly_stats_cache"
+    # A week is cached only after it has been closed this long, so late-delivered alerts are still counted.
+    WEEKLY_STATS_CACHE_GRACE_HOURS = float(os.getenv("WEEKLY_STATS_CACHE_GRACE_HOURS", 24))
+    # Weeks of history in the weekly report's trend section (0 disables it) and how many groups get a sparkline.
+    WEEKLY_TREND_WEEKS = int(os.getenv("WEEKLY_TREND_WEEKS", 12))
+    WEEKLY_TREND_TOP_GROUPS = int(os.getenv("WEEKLY_TREND_TOP_GROUPS", 10))
 
     # --- SMTP Email Settings ---
     SMTP_HOST = os.getenv("SMTP_HOST")
@@ -25,10 +69,44 @@ class Settings:
     SMTP_USER = os.getenv("SMTP_USER")
     SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
     SENDER_EMAIL = os.getenv("SENDER_EMAIL")
+    # Authenticated sessions kept open for the whole run; raise to MONITOR_WORKERS for concurrent runs.
+    SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 1))
+    SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+    # EMAIL_IMAGE_MODE: INLINE (Base64 data URIs in the HTML) or CID (multipart/related attachments)
+    EMAIL_IMAGE_MODE = os.getenv("EMAIL_IMAGE_MODE", "INLINE").upper()
+    # EMAIL_DISPATCH_MODE: SYNC (send inline) or ASYNC (queue and deliver on sender threads)
+    EMAIL_DISPATCH_MODE = os.getenv("EMAIL_DISPATCH_MODE", "SYNC").upper()
+    EMAIL_SENDER_WORKERS = int(os.getenv("EMAIL_SENDER_WORKERS", SMTP_POOL_SIZE))
+    # Token-bucket limit on outgoing messages per second (0 = unlimited) and the burst allowed above it.
+    EMAIL_RATE_PER_SECOND = float(os.getenv("EMAIL_RATE_PER_SECOND", 0))
+    EMAIL_RATE_BURST = int(os.getenv("EMAIL_RATE_BURST", 1))
+    # OUTBOX_BACKEND: MONGO (emailOutbox collection), SQLITE (local file at OUTBOX_SQLITE_PATH) or NONE
+    OUTBOX_BACKEND = os.getenv("OUTBOX_BACKEND", "MONGO").upper()
+    OUTBOX_SQLITE_PATH = os.getenv("OUTBOX_SQLITE_PATH") or "./outbox/email_outbox.sqlite3"
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+    OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 5))
+    # Pending emails older than this (e.g. left by a crashed run) are marked failed instead of being sent late.
+    OUTBOX_MAX_AGE_HOURS = float(os.getenv("OUTBOX_MAX_AGE_HOURS", 12))
+    # Sent and failed emails are kept this long for inspection, then deleted.
+    OUTBOX_RETENTION_DAYS = float(os.getenv("OUTBOX_RETENTION_DAYS", 7))
     
     TEST_RECIPIENTS_STR = os.getenv("TEST_RECIPIENTS", "")
     TEST_RECIPIENTS = [email.strip() for email in TEST_RECIPIENTS_STR.split(',') if email.strip()]
 
+    # --- Log Maintenance ---
+    # MAINTENANCE_MODE: BIANNUAL (export + bulk delete of a six-month period) or NIGHTLY (export + TTL expiry)
+    MAINTENANCE_MODE = os.getenv("MAINTENANCE_MODE", "BIANNUAL").upper()
+    # NIGHTLY mode: exported eodDelayLogs documents expire this many days after their timestamp.
+    LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", 183))
+    MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", 1000))
+    # eodDelayLogs archives: JSONL (canonical extended JSON, one document per line) or BSON (mongorestore-compatible once gunzipped)
+    ARCHIVE_FORMAT = os.getenv("ARCHIVE_FORMAT", "JSONL").upper()
+    ARCHIVE_GZIP_LEVEL = int(os.getenv("ARCHIVE_GZIP_LEVEL", 6))
+    # Log file archives, one zip per month: LOG_ARCHIVE_CODEC is DEFLATE, LZMA, BZIP2 or ZSTD (Python 3.14+).
+    LOG_ARCHIVE_CODEC = os.getenv("LOG_ARCHIVE_CODEC", "DEFLATE").upper()
+    LOG_ARCHIVE_LEVEL = int(os.getenv("LOG_ARCHIVE_LEVEL")) if os.getenv("LOG_ARCHIVE_LEVEL") else None
+    LOG_ARCHIVE_WORKERS = int(os.getenv("LOG_ARCHIVE_WORKERS", os.cpu_count() or 1))
+
     # --- MODIFICATION: Added all MongoDB systemSettings Keys ---
     IT_CORE_MONITORING_KEY = os.getenv("IT_CORE_MONITORING_KEY", "IT_CORE_MONITORING")
     BRANCH_DISTRIBUTION_CHANNELS_KEY = os.getenv("BRANCH_DISTRIBUTION_CHANNELS_KEY", "BRANCH_DISTRIBUTION_CHANNELS")
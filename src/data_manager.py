@@ -1,96 +1,392 @@
 import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timedelta
 
 import oracledb
-from pymongo import MongoClient
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
 
 from .config import settings
+from .outbox import create_outbox
+from .week_cache import create_week_cache, iso_week_key
+from .queries import HEAD_OFFICE_BRANCH_CODE, PARSE_STATS_QUERY, QUERY_CATALOG, QUERY_FETCH_SIZES, QUERY_ROW_TYPES, READ_ONLY_TRANSACTION, BRANCH_CODE_LIST_TYPE, SNAPSHOT_CACHED_QUERIES, AuthorizationRow, AuthTotals, QueryStats
 
 class DataManager:
     """
     Data Abstraction Layer.
     Connects to Oracle for operational data and MongoDB for configuration.
+    Scripts that only touch MongoDB pass oracle=False and never open an Oracle pool, and can skip the
+    startup query-plan check with verify_query_plans=False.
     """
-    def __init__(self):
-        self._op_source = _OracleSource()
-        self._config_source = _MongoSource()
+    def __init__(self, oracle: bool = True, verify_query_plans: bool = None):
+        self._op_source = _OracleSource() if oracle else None
+        self._config_source = _MongoSource(settings.MONGO_VERIFY_QUERY_PLANS if verify_query_plans is None else verify_query_plans)
+        self._branch_directory = None
+        self._branch_directory_lock = threading.Lock()
 
     # --- Operational Data Methods ---
-    def get_pending_signouts(self): return self._op_source.get_pending_signouts()
-    def get_branch_authorizations(self): return self._op_source.get_branch_authorizations()
-    def get_head_office_authorizations(self): return self._op_source.get_head_office_authorizations()
+    def iter_pending_signouts(self): return self._op_source.iter_pending_signouts()
+    def get_branch_authorization_totals(self): return self._op_source.get_branch_authorization_totals()
+    def group_branch_authorizations_for(self, branch_codes: list): return self._op_source.group_branch_authorizations_for(branch_codes)
+    def iter_head_office_authorizations(self): return self._op_source.iter_head_office_authorizations()
     def get_head_office_user_map(self): return self._op_source.get_head_office_user_map()
-    def get_pending_common_authorizations(self): return self._op_source.get_pending_common_authorizations()
-    def get_pending_teller_signouts(self): return self._op_source.get_pending_teller_signouts()
+    def get_common_authorization_counts(self): return self._op_source.get_common_authorization_counts()
+    def iter_common_authorizations_for(self, branch_codes: list): return self._op_source.iter_common_authorizations_for(branch_codes)
+    def get_teller_signout_counts(self): return self._op_source.get_teller_signout_counts()
+    def iter_teller_signouts_for(self, branch_codes: list): return self._op_source.iter_teller_signouts_for(branch_codes)
+    def log_query_stats(self): self._op_source.log_query_stats()
+    def queue_snapshot(self, date_str: str = None):
+        """Context manager for one consistent read of every queue (ORACLE_QUEUE_SNAPSHOT); a no-op when disabled."""
+        return self._op_source.snapshot(date_str) if settings.ORACLE_QUEUE_SNAPSHOT else nullcontext()
 
     # --- Configuration Data Methods ---
-    def get_branch_config(self, branch_code: int): return self._config_source.get_branch_config(branch_code)
+    def get_branch_directory(self):
+        """Returns the run's shared BranchDirectory, loading it from MongoDB on first use."""
+        with self._branch_directory_lock:
+            if self._branch_directory is None:
+                self._branch_directory = BranchDirectory(self._config_source.get_all_branches(BranchDirectory.PROJECTION))
+                logging.info(f"Loaded branch directory with {len(self._branch_directory)} branches.")
+            return self._branch_directory
+
+    def get_branch_config(self, branch_code: int): return self.get_branch_directory().get(branch_code)
     def get_department_by_id(self, dept_id: str): return self._config_source.get_department_by_id(dept_id)
     def get_system_setting(self, setting_key: str): return self._config_source.get_system_setting(setting_key)
-    def get_weekly_delay_stats(self): return self._config_source.get_weekly_delay_stats()
+    def get_weekly_delay_stats(self, trend_weeks: int = 0): return self._config_source.get_weekly_delay_stats(trend_weeks)
+    def get_weekly_stats_history(self, weeks: int): return self._config_source.get_weekly_stats_history(weeks)
     def log_notification(self, log_entry: dict): self._config_source.log_notification(log_entry)
+    def flush_notifications(self): self._config_source.flush_notifications()
+    def get_outbox(self, source: str): return create_outbox(self._config_source.db, source)
+    def backfill_group_names(self): self._config_source.backfill_group_names()
+    def rebuild_daily_rollup(self, start: datetime = None, end: datetime = None, all_days: bool = False): self._config_source.rebuild_daily_rollup(start, end, all_days)
+
+
+class BranchDirectory:
+    """
+    In-memory snapshot of the branches collection, keyed by branch code.
+    Loaded with a single projected find() so lookups during a run never go back to MongoDB.
+    """
+    PROJECTION = {"name": 1, "supervisorEmails": 1}
+
+    def __init__(self, branches):
+        self._by_code = {branch["_id"]: branch for branch in branches}
+
+    def __len__(self):
+        return len(self._by_code)
+
+    def get(self, branch_code: int):
+        return self._by_code.get(branch_code)
+
+    def name_for(self, branch_code: int, default: str = "Unknown Branch"):
+        config = self._by_code.get(branch_code)
+        return config.get("name", default) if config else default
 
 
 class _OracleSource:
+    MODULE = "EOD_MONITOR"
+
     def __init__(self):
         try:
-            self.pool = oracledb.create_pool(user=settings.ORACLE_USER, password=settings.ORACLE_PASSWORD, dsn=settings.ORACLE_DSN, min=1, max=2, increment=1)
-            logging.info("Oracle connection pool created successfully.")
+            self.pool = oracledb.create_pool(user=settings.ORACLE_USER, password=settings.ORACLE_PASSWORD, dsn=settings.ORACLE_DSN, min=settings.ORACLE_POOL_MIN, max=settings.ORACLE_POOL_MAX, increment=1, stmtcachesize=settings.ORACLE_STMT_CACHE_SIZE)
+            logging.info(f"Oracle connection pool created successfully (min={settings.ORACLE_POOL_MIN}, max={settings.ORACLE_POOL_MAX}).")
         except Exception as e:
             logging.critical(f"Failed to create Oracle connection pool: {e}")
             raise
+        self.query_stats = QueryStats()
+        # Set while a queue snapshot is open: its connection, a lock serialising the monitors on it, and the results read so far.
+        self._snapshot, self._snapshot_lock, self._snapshot_results = None, threading.Lock(), {}
+        # pyarrow is imported only in COLUMNAR mode, so ROWS runs do not pay its import time.
+        self._pyarrow = _load_pyarrow() if settings.ORACLE_FETCH_MODE == "COLUMNAR" else None
+        self.columnar = self._pyarrow is not None
+        if settings.ORACLE_FETCH_MODE == "COLUMNAR" and not self.columnar:
+            logging.warning("ORACLE_FETCH_MODE=COLUMNAR needs pyarrow and python-oracledb 3.0+. Falling back to the row fetch path.")
+
+    def _iter_query(self, query_name: str, params: dict = None):
+        """
+        Runs a named statement from QUERY_CATALOG with bind variables and returns an iterator over its rows, built
+        by the driver as the query's QUERY_ROW_TYPES tuple. Outside a snapshot the rows are streamed from a pooled
+        connection; inside one they come from the snapshot's connection and transaction.
+        """
+        if self._snapshot is not None: return self._snapshot_rows(query_name, params or {})
+        return self._stream_rows(query_name, params or {})
+
+    def _prepare(self, connection, query_name: str, params: dict) -> dict:
+        """Tags the session with the catalog entry and returns the binds for `params`."""
+        # Tag the session so V$SQL / V$SESSION attribute work to the catalog entry.
+        connection.module = self.MODULE
+        connection.action = query_name
+        # A tuple of branch codes is bound as one SQL collection (see IN_BRANCH_CODES).
+        return {name: connection.gettype(BRANCH_CODE_LIST_TYPE).newobject(list(value)) if isinstance(value, tuple) else value for name, value in params.items()}
+
+    def _fetch_batches(self, connection, query_name: str, params: dict, lock=None):
+        """
+        Executes a catalog statement on `connection` and yields its rows one fetch batch at a time. `lock`, if given,
+        is held for each round trip (the execute and every fetchmany) but never while a batch is being yielded.
+        """
+        lock = lock or nullcontext()
+        arraysize, prefetchrows = settings.ORACLE_FETCH_SIZES.get(query_name) or QUERY_FETCH_SIZES[query_name]
+        with connection.cursor() as cursor:
+            cursor.arraysize = arraysize
+            cursor.prefetchrows = prefetchrows
+            with lock: cursor.execute(QUERY_CATALOG[query_name], self._prepare(connection, query_name, params))
+            cursor.rowfactory = QUERY_ROW_TYPES[query_name]
+            while True:
+                with lock: batch = cursor.fetchmany()
+                if not batch: return
+                yield batch
+
+    def _fetch_table(self, query_name: str, params: dict):
+        """
+        COLUMNAR fetch of a catalog statement: its Arrow record batches (arraysize rows each) joined into one table,
+        or None when there are no rows. Uses the snapshot connection when one is open, otherwise a pooled one.
+        """
+        arraysize, _ = settings.ORACLE_FETCH_SIZES.get(query_name) or QUERY_FETCH_SIZES[query_name]
+        started, snapshot = time.perf_counter(), self._snapshot
+        lock, frames, batches = self._snapshot_lock if snapshot is not None else nullcontext(), None, []
+        with (nullcontext(snapshot) if snapshot is not None else self.pool.acquire()) as connection:
+            # As in _fetch_batches, the snapshot lock is held per round trip; the statement executes on the first batch.
+            while True:
+                with lock:
+                    if frames is None: frames = connection.fetch_df_batches(QUERY_CATALOG[query_name], self._prepare(connection, query_name, params), size=arraysize)
+                    frame = next(frames, None)
+                if frame is None: break
+                batches.append(self._pyarrow.table(frame))
+        table = self._pyarrow.concat_tables(batches) if batches else None
+        self.query_stats.record(query_name, table.num_rows if table is not None else 0, time.perf_counter() - started)
+        return table
 
-    def _execute_query(self, query: str):
+    def _stream_rows(self, query_name: str, params: dict):
+        """
+        Yields rows one fetch batch at a time so only a single batch is held in memory. The pooled connection
+        stays checked out until the stream is exhausted or closed; the execution is recorded then.
+        """
+        started, row_count = time.perf_counter(), 0
+        try:
+            with self.pool.acquire() as connection:
+                for batch in self._fetch_batches(connection, query_name, params):
+                    row_count += len(batch)
+                    yield from batch
+        finally:
+            self.query_stats.record(query_name, row_count, time.perf_counter() - started)
+
+    def _snapshot_rows(self, query_name: str, params: dict):
+        """
+        Runs a query on the snapshot connection, one query at a time whichever monitor thread asks. The queue summaries
+        (SNAPSHOT_CACHED_QUERIES) are read in full under the lock and kept, so asking again for the same binds costs
+        no round trip; anything else is streamed by _stream_snapshot_rows.
+        """
+        if query_name not in SNAPSHOT_CACHED_QUERIES: return self._stream_snapshot_rows(self._snapshot, query_name, params)
+        key = (query_name, tuple(sorted(params.items())))
+        with self._snapshot_lock:
+            if key not in self._snapshot_results:
+                started, rows = time.perf_counter(), []
+                for batch in self._fetch_batches(self._snapshot, query_name, params): rows.extend(batch)
+                self.query_stats.record(query_name, len(rows), time.perf_counter() - started)
+                self._snapshot_results[key] = rows
+            return iter(self._snapshot_results[key])
+
+    def _stream_snapshot_rows(self, connection, query_name: str, params: dict):
+        """
+        Yields a query's rows batch by batch from the snapshot connection, on a cursor of its own. The lock is taken
+        per round trip only, so a monitor that stops part-way through never blocks the others.
+        """
+        started, fetched = time.perf_counter(), 0
+        try:
+            for batch in self._fetch_batches(connection, query_name, params, self._snapshot_lock):
+                fetched += len(batch)
+                yield from batch
+        finally:
+            self.query_stats.record(query_name, fetched, time.perf_counter() - started)
+
+    @contextmanager
+    def snapshot(self, date_str: str = None):
+        """
+        Holds one pooled connection in a READ ONLY transaction for the duration of the block. The four queue summaries
+        are read together, back to back, as it opens, and kept; every query run inside the block, including per-branch
+        detail streamed later for alerts, uses the same connection and sees the queues as of the moment the snapshot opened.
+        """
+        started = time.perf_counter()
         with self.pool.acquire() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                columns = [col[0] for col in cursor.description]
-                return [dict(zip(columns, row)) for row in cursor]
-
-    def get_pending_signouts(self, date_str: str = None):
-        date_filter = f"TO_DATE('{date_str}', 'DD-MON-YYYY')" if date_str else "TRUNC(SYSDATE)"
-        query = f"SELECT * FROM brnstatus WHERE BRNSTATUS_STATUS = 'I' AND BRNSTATUS_CURR_DATE = {date_filter}"
-        logging.info(f"Querying for pending signouts with filter: {date_filter}")
-        return self._execute_query(query)
-
-    def get_branch_authorizations(self, date_str: str = None):
-        date_filter = f"TO_DATE('{date_str}', 'DD-MON-YYYY')" if date_str else "TRUNC(SYSDATE)"
-        query = f"SELECT * FROM bopauthq WHERE BOPAUTHQ_ENTRY_STATUS = 'N' AND BOPAUTHQ_TRAN_DATE_OF_TRAN = {date_filter} AND BOPAUTHQ_TRAN_BRN_CODE != 100"
-        logging.info(f"Querying for BRANCH pending authorizations with filter: {date_filter}")
-        return self._execute_query(query)
-
-    def get_head_office_authorizations(self, date_str: str = None):
-        date_filter = f"TO_DATE('{date_str}', 'DD-MON-YYYY')" if date_str else "TRUNC(SYSDATE)"
-        query = f"SELECT * FROM bopauthq WHERE BOPAUTHQ_ENTRY_STATUS = 'N' AND BOPAUTHQ_TRAN_DATE_OF_TRAN = {date_filter} AND BOPAUTHQ_TRAN_BRN_CODE = 100"
-        logging.info(f"Querying for HEAD OFFICE pending authorizations with filter: {date_filter}")
-        return self._execute_query(query)
+            connection.module = self.MODULE
+            connection.action = "queue_snapshot"
+            with connection.cursor() as cursor: cursor.execute(READ_ONLY_TRANSACTION)
+            self._snapshot, self._snapshot_results = connection, {}
+            try:
+                list(self.iter_pending_signouts(date_str))
+                self.get_branch_authorization_totals(date_str)
+                self.get_teller_signout_counts(date_str)
+                self.get_common_authorization_counts(date_str)
+                logging.info(f"Queue snapshot opened: queue summaries read on one connection in {time.perf_counter() - started:.2f}s.")
+                yield
+            finally:
+                self._snapshot, self._snapshot_results = None, {}
+                # Ends the read-only transaction before the connection goes back to the pool. A dead connection must not
+                # hide whatever error ended the block.
+                try:
+                    connection.rollback()
+                except oracledb.Error as e:
+                    logging.warning(f"Could not end the queue snapshot transaction: {e}")
+
+    def log_query_stats(self):
+        self.query_stats.log_summary()
+        if not settings.ORACLE_REPORT_PARSE_STATS: return
+        try:
+            with self.pool.acquire() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(PARSE_STATS_QUERY, module=self.MODULE)
+                    for action, parse_calls, executions in cursor:
+                        logging.info(f"V$SQL '{action}': {parse_calls} parse calls, {executions} executions (cumulative)")
+        except Exception as e:
+            logging.warning(f"Could not read parse statistics from V$SQL: {e}")
+
+    # The iter_* methods stream their rows; each result can be iterated once.
+    def iter_pending_signouts(self, date_str: str = None):
+        logging.info(f"Querying for pending signouts for run date: {date_str or 'today'}")
+        return self._iter_query("pending_signouts", {"run_date": date_str})
+
+    def iter_head_office_authorizations(self, date_str: str = None):
+        logging.info(f"Querying for HEAD OFFICE pending authorizations for run date: {date_str or 'today'}")
+        return self._iter_query("head_office_authorizations", {"run_date": date_str, "ho_branch_code": HEAD_OFFICE_BRANCH_CODE})
+
+    # --- Per-branch summaries ---
+    # Counts and amounts are aggregated by the database (one row per branch); the matching *_for methods
+    # fetch row detail in one query for just the branches whose alerts need it.
+    def get_branch_authorization_totals(self, date_str: str = None):
+        """Returns {branch_code: AuthTotals(count, amount)} for the branch authorization queue."""
+        logging.info(f"Querying for BRANCH pending authorization totals for run date: {date_str or 'today'}")
+        rows = self._iter_query("branch_authorization_totals", {"run_date": date_str, "ho_branch_code": HEAD_OFFICE_BRANCH_CODE})
+        return {row.BRANCH_CODE: AuthTotals(row.ITEM_COUNT, row.TOTAL_AMOUNT or 0.0) for row in rows}
+
+    def group_branch_authorizations_for(self, branch_codes: list, date_str: str = None):
+        """
+        Returns ({branch_code: [AuthorizationRow, ...]}, {branch_code: AuthTotals}) for the given branches, from one
+        query. The totals are computed from the same rows, so an alert's header always agrees with its table.
+        """
+        if not branch_codes: return {}, {}
+        params = {"run_date": date_str, "ho_branch_code": HEAD_OFFICE_BRANCH_CODE, "branch_codes": tuple(branch_codes)}
+        if self.columnar: return self._group_authorizations_columnar(params)
+        grouped, amounts = defaultdict(list), defaultdict(float)
+        for txn in self._iter_query("branch_authorizations_for_branches", params):
+            grouped[txn.BOPAUTHQ_TRAN_BRN_CODE].append(txn)
+            amounts[txn.BOPAUTHQ_TRAN_BRN_CODE] += txn.BOPAUTHQ_AMT_INVOLVED_IN_BC or 0
+        return grouped, {code: AuthTotals(len(txns), amounts[code]) for code, txns in grouped.items()}
+
+    def _group_authorizations_columnar(self, params: dict):
+        """COLUMNAR variant: fetches the rows as one Arrow table and computes the per-branch totals with Arrow's group_by kernels."""
+        pyarrow = self._pyarrow
+        table = self._fetch_table("branch_authorizations_for_branches", params)
+        if table is None: return {}, {}
+        code_column, amount_column = "BOPAUTHQ_TRAN_BRN_CODE", "BOPAUTHQ_AMT_INVOLVED_IN_BC"
+        # NUMBER columns arrive as doubles; branch codes are keyed as ints everywhere else.
+        table = table.set_column(table.schema.get_field_index(code_column), code_column, table[code_column].cast(pyarrow.int64()))
+        summary = table.group_by(code_column).aggregate([([], "count_all"), (amount_column, "sum")]).to_pydict()
+        totals = {code: AuthTotals(count, amount or 0.0) for code, count, amount in zip(summary[code_column], summary["count_all"], summary[f"{amount_column}_sum"])}
+        # The alert template lists the rows themselves, so they are still built as AuthorizationRow tuples.
+        grouped = defaultdict(list)
+        for txn in map(AuthorizationRow._make, zip(*(table[name].to_pylist() for name in AuthorizationRow._fields))):
+            grouped[txn.BOPAUTHQ_TRAN_BRN_CODE].append(txn)
+        return grouped, totals
 
     def get_head_office_user_map(self):
-        query = "SELECT USER_ID, USER_DEPT_CODE FROM users WHERE USER_BRANCH_CODE = 100"
         logging.info("Fetching Head Office user-to-department map from Oracle.")
-        user_list = self._execute_query(query)
-        return {user['USER_ID']: user['USER_DEPT_CODE'] for user in user_list}
+        return {user.USER_ID: user.USER_DEPT_CODE for user in self._iter_query("head_office_user_map", {"ho_branch_code": HEAD_OFFICE_BRANCH_CODE})}
+
+    def get_common_authorization_counts(self, date_str: str = None):
+        """Returns {branch_code: pending item count} for the common authorization queue."""
+        logging.info(f"Querying for pending common authorization counts for run date: {date_str or 'today'}")
+        return {row.BRANCH_CODE: row.ITEM_COUNT for row in self._iter_query("common_authorization_counts", {"run_date": date_str})}
 
-    def get_pending_common_authorizations(self, date_str: str = None):
-        date_filter = f"TO_DATE('{date_str}', 'DD-MON-YYYY')" if date_str else "TRUNC(SYSDATE)"
-        query = f"SELECT * FROM TBAAUTHQ t WHERE TRUNC(TBAQ_ENTRY_DATE) = {date_filter}"
-        logging.info("Querying for pending common authorizations.")
-        return self._execute_query(query)
+    def iter_common_authorizations_for(self, branch_codes: list, date_str: str = None):
+        if not branch_codes: return iter(())
+        return self._iter_query("common_authorizations_for_branches", {"run_date": date_str, "branch_codes": tuple(branch_codes)})
+
+    def get_teller_signout_counts(self, date_str: str = None):
+        """Returns {branch_code: pending teller count}."""
+        logging.info(f"Querying for pending teller signout counts for run date: {date_str or 'today'}")
+        return {row.BRANCH_CODE: row.ITEM_COUNT for row in self._iter_query("teller_signout_counts", {"run_date": date_str})}
+
+    def iter_teller_signouts_for(self, branch_codes: list, date_str: str = None):
+        if not branch_codes: return iter(())
+        return self._iter_query("teller_signouts_for_branches", {"run_date": date_str, "branch_codes": tuple(branch_codes)})
+
+
+def _load_pyarrow():
+    """Imports pyarrow for ORACLE_FETCH_MODE=COLUMNAR; None if it or Connection.fetch_df_batches (python-oracledb 3.0+) is missing."""
+    try:
+        import pyarrow
+        import pyarrow.compute
+    except ImportError:
+        return None
+    return pyarrow if hasattr(oracledb.Connection, "fetch_df_batches") else None
+
+
+def _plan_stages(plan):
+    """Yields every 'stage' name in an explain() plan tree, including nested SBE query plans."""
+    if isinstance(plan, dict):
+        if "stage" in plan: yield plan["stage"]
+        for value in plan.values(): yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan: yield from _plan_stages(value)
+
+
+def assert_index_scan(collection, query: dict):
+    """Raises RuntimeError if MongoDB would answer `query` on `collection` with a collection scan."""
+    winning_plan = collection.find(query).explain().get("queryPlanner", {}).get("winningPlan", {})
+    if "COLLSCAN" in set(_plan_stages(winning_plan)):
+        raise RuntimeError(f"Query on '{collection.name}' falls back to COLLSCAN: {query}. Check the indexes in _MongoSource.INDEXES.")
+
+
+# TTL index for NIGHTLY maintenance: a document is deleted once its expireAt has passed. Documents without
+# expireAt (not yet exported) are never expired.
+EXPIRE_AT_TTL_INDEX = ([("expireAt", ASCENDING)], {"name": "expireAt_ttl", "expireAfterSeconds": 0})
 
-    def get_pending_teller_signouts(self, date_str: str = None):
-        date_filter = f"TO_DATE('{date_str}', 'DD-MON-YYYY')" if date_str else "TRUNC(SYSDATE)"
-        query = f"SELECT * FROM cashSIGNINOUT WHERE CASHSIGN_DATE = {date_filter} AND CASHSIGN_SIGNED_OUT = 0"
-        logging.info(f"Querying for pending teller sign-outs with filter: {date_filter}")
-        return self._execute_query(query)
 
 class _MongoSource:
-    def __init__(self):
+    # Indexes each collection needs, as (keys, options). create_index is a no-op when the index already exists.
+    INDEXES = {
+        "eodDelayLogs": [
+            ([("timestamp", ASCENDING)], {"name": "timestamp_1"}),
+            ([("timestamp", ASCENDING), ("delayType", ASCENDING), ("branchId", ASCENDING)], {"name": "timestamp_1_delayType_1_branchId_1"}),
+            EXPIRE_AT_TTL_INDEX,
+        ],
+        # One document per (day, delayType, branchId, departmentId) holding the number of notifications sent.
+        "eodDelayDailyRollup": [
+            ([("day", ASCENDING), ("delayType", ASCENDING), ("branchId", ASCENDING), ("departmentId", ASCENDING)], {"name": "day_1_delayType_1_branchId_1_departmentId_1", "unique": True}),
+        ],
+    }
+
+    def __init__(self, verify_query_plans: bool = True):
         self.client = MongoClient(settings.MONGO_URI)
         self.db = self.client.get_default_database()
         logging.info("Connected to MongoDB.")
+        # Notification entries are buffered and written in bulk by flush_notifications().
+        self._delay_logs = self.db.eodDelayLogs.with_options(write_concern=WriteConcern(w=settings.MONGO_LOG_WRITE_CONCERN, j=settings.MONGO_LOG_JOURNAL))
+        self._pending_notifications = []
+        self._notifications_lock = threading.Lock()
+        # Weekly stats for weeks that have already closed, keyed by ISO week.
+        self.week_cache = create_week_cache(self.db)
+        self._ensure_indexes()
+        if verify_query_plans: self.verify_query_plans()
+
+    def _ensure_indexes(self):
+        for collection_name, indexes in self.INDEXES.items():
+            for keys, options in indexes:
+                self.db[collection_name].create_index(keys, **options)
+        logging.info("MongoDB indexes ensured.")
+
+    def verify_query_plans(self):
+        """Fails loudly if the timestamp-range queries used by reporting and maintenance would scan eodDelayLogs."""
+        now = datetime.utcnow()
+        assert_index_scan(self.db.eodDelayLogs, {"timestamp": {"$gte": now - timedelta(weeks=1), "$lte": now}})
 
     def get_branch_config(self, branch_code: int):
         return self.db.branches.find_one({"_id": branch_code})
+
+    def get_all_branches(self, projection: dict = None):
+        return list(self.db.branches.find({}, projection))
     
     def get_department_by_id(self, dept_id: str):
         return self.db.departments.find_one({"_id": dept_id})
@@ -100,15 +396,172 @@ class _MongoSource:
         return setting["value"] if setting else None
 
     def log_notification(self, log_entry: dict):
-        self.db.eodDelayLogs.insert_one(log_entry)
-        logging.info(f"Logged notification: {log_entry['delayType']} for {log_entry.get('branchId') or log_entry.get('departmentId')}")
-
-    def get_weekly_delay_stats(self):
-        today = datetime.utcnow(); start_of_this_week = (today - timedelta(days=today.weekday())).replace(hour=0, minute=0, second=0, microsecond=0); end_of_this_week = start_of_this_week + timedelta(days=6, hours=23, minutes=59, seconds=59); start_of_last_week = start_of_this_week - timedelta(weeks=1); end_of_last_week = start_of_last_week + timedelta(days=6, hours=23, minutes=59, seconds=59);
-        def run_aggregation(start_date, end_date): pipeline = [{"$match": {"timestamp": {"$gte": start_date, "$lte": end_date}}}, {"$lookup": {"from": "branches", "localField": "branchId", "foreignField": "_id", "as": "branchInfo"}}, {"$lookup": {"from": "departments", "localField": "departmentId", "foreignField": "_id", "as": "deptInfo"}}, {"$addFields": {"groupName": {"$ifNull": [{"$arrayElemAt": ["$branchInfo.name", 0]}, {"$ifNull": [{"$arrayElemAt": ["$deptInfo.name", 0]}, "Unknown"]}]}}}, {"$facet": {"byGroup": [{"$group": {"_id": "$groupName", "totalDelays": {"$sum": 1}}}, {"$sort": {"totalDelays": -1}}], "byType": [{"$group": {"_id": "$delayType", "totalDelays": {"$sum": 1}}}]}}]; results = list(self.db.eodDelayLogs.aggregate(pipeline)); return results[0] if results else {"byGroup": [], "byType": []}
-        stats_this_week = run_aggregation(start_of_this_week, end_of_this_week); stats_last_week = run_aggregation(start_of_last_week, end_of_last_week); total_incidents_this_week = sum(item['totalDelays'] for item in stats_this_week.get('byGroup', [])); total_incidents_last_week = sum(item['totalDelays'] for item in stats_last_week.get('byGroup', [])); trend_percent = "N/A"; trend_direction = "neutral";
-        if total_incidents_last_week > 0: change = total_incidents_this_week - total_incidents_last_week; percent_change = (change / total_incidents_last_week) * 100; trend_percent = f"{percent_change:+.1f}%";
+        with self._notifications_lock:
+            self._pending_notifications.append(log_entry)
+            batch_full = len(self._pending_notifications) >= settings.NOTIFICATION_LOG_BATCH_SIZE
+        if batch_full: self.flush_notifications()
+
+    def flush_notifications(self):
+        """
+        Writes all buffered notification entries with one unordered insert_many. Entries that were not written are
+        put back at the front of the buffer for the next flush. insert_many stamps every entry with its _id first,
+        so an entry that was in fact written before an error is rejected as a duplicate on retry, never stored twice.
+        """
+        with self._notifications_lock:
+            batch, self._pending_notifications = self._pending_notifications, []
+        if not batch: return
+        try:
+            self._delay_logs.insert_many(batch, ordered=False)
+            written = batch
+        except BulkWriteError as e:
+            # Duplicate keys (11000) are entries already written by an earlier, failed-looking flush.
+            failed = {error["index"] for error in e.details.get("writeErrors", []) if error.get("code") != 11000}
+            written = [entry for i, entry in enumerate(batch) if i not in failed]
+            self._requeue_notifications([entry for i, entry in enumerate(batch) if i in failed])
+            if failed: logging.error(f"{len(failed)} of {len(batch)} notification log entries were not written; they stay buffered for the next flush: {e}")
+        except Exception as e:
+            self._requeue_notifications(batch)
+            logging.error(f"Failed to write {len(batch)} notification log entries; they stay buffered for the next flush: {e}", exc_info=True)
+            return
+        if not written: return
+        for entry in written: logging.info(f"Logged notification: {entry['delayType']} for {entry.get('branchId') or entry.get('departmentId')}")
+        logging.info(f"Wrote {len(written)} notification log entries to eodDelayLogs.")
+        try:
+            self._add_to_daily_rollup(written)
+        except Exception as e:
+            logging.error(f"Failed to update eodDelayDailyRollup; run data_backfill.py to rebuild it: {e}", exc_info=True)
+
+    def _requeue_notifications(self, entries: list):
+        with self._notifications_lock:
+            self._pending_notifications[:0] = entries
+
+    def _add_to_daily_rollup(self, batch: list):
+        """Counts a batch of notification entries into the daily rollup with one $inc upsert per rollup key."""
+        counts, groups = Counter(), {}
+        for entry in batch:
+            key = (entry["timestamp"].replace(hour=0, minute=0, second=0, microsecond=0), entry["delayType"], entry.get("branchId"), entry.get("departmentId"))
+            counts[key] += 1
+            groups[key] = {"groupName": entry.get("groupName") or "Unknown", "groupType": entry.get("groupType")}
+        updates = [UpdateOne({"day": day, "delayType": delay_type, "branchId": branch_id, "departmentId": department_id}, {"$inc": {"count": count}, "$set": groups[(day, delay_type, branch_id, department_id)]}, upsert=True) for (day, delay_type, branch_id, department_id), count in counts.items()]
+        self.db.eodDelayDailyRollup.bulk_write(updates, ordered=False)
+
+    def backfill_group_names(self):
+        """
+        Stores groupName/groupType on eodDelayLogs documents written before they were denormalized.
+        Issues one update_many per distinct (branchId, departmentId) pair, so the cost is per group, not per document.
+        """
+        missing = {"groupName": {"$exists": False}}
+        pairs = list(self.db.eodDelayLogs.aggregate([{"$match": missing}, {"$group": {"_id": {"branchId": "$branchId", "departmentId": "$departmentId"}}}]))
+        branch_names = {b["_id"]: b.get("name") for b in self.db.branches.find({}, {"name": 1})}
+        dept_names = {d["_id"]: d.get("name") for d in self.db.departments.find({}, {"name": 1})}
+        updated = 0
+        for pair in pairs:
+            branch_id, department_id = pair["_id"].get("branchId"), pair["_id"].get("departmentId")
+            group_name = dept_names.get(department_id) if department_id else branch_names.get(branch_id)
+            group_fields = {"groupName": group_name or "Unknown", "groupType": "department" if department_id else "branch"}
+            updated += self.db.eodDelayLogs.update_many({**missing, "branchId": branch_id, "departmentId": department_id}, {"$set": group_fields}).modified_count
+        logging.info(f"Backfilled group names on {updated} eodDelayLogs documents across {len(pairs)} groups.")
+
+    def raw_log_days(self):
+        """
+        (first day, last timestamp) still fully covered by raw eodDelayLogs, or None when there are none.
+        Once the TTL index is expiring logs (NIGHTLY maintenance) the oldest day may be partly gone, so it is skipped.
+        """
+        first = self.db.eodDelayLogs.find_one({}, {"timestamp": 1}, sort=[("timestamp", ASCENDING)])
+        if not first: return None
+        last = self.db.eodDelayLogs.find_one({}, {"timestamp": 1}, sort=[("timestamp", -1)])
+        first_day = first["timestamp"].replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.db.eodDelayLogs.find_one({"expireAt": {"$ne": None}}, {"_id": 1}): first_day += timedelta(days=1)
+        return (first_day, last["timestamp"]) if first_day <= last["timestamp"] else None
+
+    def rebuild_daily_rollup(self, start: datetime = None, end: datetime = None, all_days: bool = False):
+        """
+        Recomputes eodDelayDailyRollup from the raw eodDelayLogs for the given UTC days. With no range, only the days
+        still covered by raw logs are rebuilt, so rollup history for archived and purged periods is kept.
+        all_days=True wipes the whole rollup first and rebuilds it from whatever raw logs remain.
+        Run backfill_group_names() first.
+        """
+        if start is None and end is None and not all_days:
+            covered = self.raw_log_days()
+            if not covered:
+                logging.info("No raw eodDelayLogs cover a full day; eodDelayDailyRollup left unchanged.")
+                return
+            start, end = covered
+            logging.info(f"Rebuilding eodDelayDailyRollup for the days covered by raw logs: {start:%Y-%m-%d} to {end:%Y-%m-%d}.")
+        elif all_days:
+            logging.warning("Rebuilding ALL of eodDelayDailyRollup; history for purged periods will be lost.")
+        day_range = {k: v for k, v in (("$gte", start), ("$lte", end)) if v is not None}
+        self.db.eodDelayDailyRollup.delete_many({"day": day_range} if day_range else {})
+        # Cached weekly stats were computed from the rollup being replaced.
+        self.week_cache.clear()
+        pipeline = [
+            {"$match": {"timestamp": day_range} if day_range else {}},
+            {"$sort": {"timestamp": 1}},
+            {"$group": {"_id": {"day": {"$dateFromParts": {"year": {"$year": "$timestamp"}, "month": {"$month": "$timestamp"}, "day": {"$dayOfMonth": "$timestamp"}}}, "delayType": "$delayType", "branchId": "$branchId", "departmentId": "$departmentId"}, "count": {"$sum": 1}, "groupName": {"$last": "$groupName"}, "groupType": {"$last": "$groupType"}}},
+            {"$project": {"_id": 0, "day": "$_id.day", "delayType": "$_id.delayType", "branchId": {"$ifNull": ["$_id.branchId", None]}, "departmentId": {"$ifNull": ["$_id.departmentId", None]}, "count": 1, "groupName": {"$ifNull": ["$groupName", "Unknown"]}, "groupType": 1}},
+            {"$merge": {"into": "eodDelayDailyRollup", "on": ["day", "delayType", "branchId", "departmentId"], "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ]
+        self.db.eodDelayLogs.aggregate(pipeline)
+        logging.info(f"Rebuilt eodDelayDailyRollup: {self.db.eodDelayDailyRollup.count_documents({})} rollup documents.")
+
+    def _aggregate_weeks(self, first_week_start: datetime, weeks: int) -> list:
+        """
+        Returns one {"byGroup": [...], "byType": [...]} per week starting at first_week_start, oldest first,
+        from a single pass over the daily rollup: one $match for the whole window and one $facet keyed by week bucket.
+        """
+        window_end = first_week_start + timedelta(weeks=weeks)
+        week_bucket = {"$floor": {"$divide": [{"$subtract": ["$day", first_week_start]}, timedelta(weeks=1).total_seconds() * 1000]}}
+        pipeline = [
+            {"$match": {"day": {"$gte": first_week_start, "$lt": window_end}}},
+            {"$addFields": {"week": week_bucket}},
+            {"$facet": {
+                "byGroup": [{"$group": {"_id": {"week": "$week", "group": {"$ifNull": ["$groupName", "Unknown"]}}, "totalDelays": {"$sum": "$count"}}}, {"$sort": {"totalDelays": -1}}],
+                "byType": [{"$group": {"_id": {"week": "$week", "type": "$delayType"}, "totalDelays": {"$sum": "$count"}}}],
+            }},
+        ]
+        results = list(self.db.eodDelayDailyRollup.aggregate(pipeline))
+        facets = results[0] if results else {"byGroup": [], "byType": []}
+        stats = [{"byGroup": [], "byType": []} for _ in range(weeks)]
+        for item in facets["byGroup"]: stats[int(item["_id"]["week"])]["byGroup"].append({"_id": item["_id"]["group"], "totalDelays": item["totalDelays"]})
+        for item in facets["byType"]: stats[int(item["_id"]["week"])]["byType"].append({"_id": item["_id"]["type"], "totalDelays": item["totalDelays"]})
+        return stats
+
+    def get_weekly_stats_history(self, weeks: int) -> list:
+        """
+        Returns [(week_start, stats), ...] for the last `weeks` weeks, oldest first, ending with the open week.
+        Closed weeks come from the week cache; any that are missing are computed together with the open week
+        in one rollup aggregation and then cached. Raw eodDelayLogs are never read.
+        """
+        today = datetime.utcnow()
+        start_of_this_week = (today - timedelta(days=today.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+        week_starts = [start_of_this_week - timedelta(weeks=n) for n in range(weeks - 1, -1, -1)]
+        # A week is only cached once late deliveries (e.g. outbox retries) can no longer land in it.
+        cacheable = [w for w in week_starts if w + timedelta(weeks=1, hours=settings.WEEKLY_STATS_CACHE_GRACE_HOURS) <= today]
+        cached = self.week_cache.get_many([iso_week_key(w) for w in cacheable])
+        first_live = next((w for w in week_starts if iso_week_key(w) not in cached), start_of_this_week)
+        live_stats = self._aggregate_weeks(first_live, len([w for w in week_starts if w >= first_live]))
+        history = []
+        for week_start in week_starts:
+            key = iso_week_key(week_start)
+            if key in cached:
+                history.append((week_start, cached[key]))
+                continue
+            stats = live_stats[(week_start - first_live) // timedelta(weeks=1)]
+            if week_start in cacheable: self.week_cache.put(key, week_start, stats)
+            history.append((week_start, stats))
+        logging.info(f"Weekly stats history: {len(cached)} of {weeks} weeks served from cache.")
+        return history
+
+    def get_weekly_delay_stats(self, trend_weeks: int = 0):
+        today = datetime.utcnow(); start_of_this_week = (today - timedelta(days=today.weekday())).replace(hour=0, minute=0, second=0, microsecond=0); end_of_this_week = start_of_this_week + timedelta(days=6, hours=23, minutes=59, seconds=59); start_of_last_week = start_of_this_week - timedelta(weeks=1)
+        # Last week (and any trend history) is served from the closed-week cache; only the open week is aggregated live.
+        history = self.get_weekly_stats_history(max(2, trend_weeks))
+        (_, stats_last_week), (_, stats_this_week) = history[-2:]
+        total_incidents_this_week = sum(item['totalDelays'] for item in stats_this_week.get('byGroup', [])); total_incidents_last_week = sum(item['totalDelays'] for item in stats_last_week.get('byGroup', []))
+        change = total_incidents_this_week - total_incidents_last_week
+        trend_direction = "up" if change > 0 else "down" if change < 0 else "neutral"
+        trend_percent = f"{(change / total_incidents_last_week) * 100:+.1f}%" if total_incidents_last_week > 0 else "N/A"
         top_offender_name = "N/A"; top_offender_count = 0;
         if stats_this_week.get('byGroup'): top_offender_name = stats_this_week['byGroup'][0]['_id']; top_offender_count = stats_this_week['byGroup'][0]['totalDelays']
         auth_delays = next((item['totalDelays'] for item in stats_this_week.get('byType', []) if item['_id'] == 'authorization'), 0); signout_delays = next((item['totalDelays'] for item in stats_this_week.get('byType', []) if item['_id'] == 'sign-out'), 0);
-        return {"stats": stats_this_week, "startDate": start_of_this_week.strftime('%d-%b-%Y'), "endDate": end_of_this_week.strftime('%d-%b-%Y'), "metrics": {"total_incidents": total_incidents_this_week, "trend_percent": trend_percent, "trend_direction": trend_direction, "top_offender_name": top_offender_name, "top_offender_count": top_offender_count, "auth_delays": auth_delays, "signout_delays": signout_delays}}
\ No newline at end of file
+        return {"stats": stats_this_week, "startDate": start_of_this_week.strftime('%d-%b-%Y'), "endDate": end_of_this_week.strftime('%d-%b-%Y'), "metrics": {"total_incidents": total_incidents_this_week, "total_incidents_last_week": total_incidents_last_week, "trend_percent": trend_percent, "trend_direction": trend_direction, "top_offender_name": top_offender_name, "top_offender_count": top_offender_count, "auth_delays": auth_delays, "signout_delays": signout_delays}, "history": history[-trend_weeks:] if trend_weeks else []}
\ No newline at end of file
@@ -0,0 +1,67 @@
+import logging
+import queue
+import threading
+import time
+
+
+class TokenBucket:
+    """Blocking token-bucket rate limiter: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmailDispatcher:
+    """
+    In-process queue of finished messages drained by a pool of sender threads.
+    Callers return as soon as a message is enqueued; flush() blocks until every queued message
+    has been handled, so it is the barrier to wait on before the process exits.
+    """
+
+    def __init__(self, deliver, workers: int = 1, rate_per_second: float = 0, burst: int = 1):
+        self._deliver = deliver
+        self._queue = queue.Queue()
+        self._bucket = TokenBucket(rate_per_second, burst) if rate_per_second > 0 else None
+        self._threads = [threading.Thread(target=self._worker, name=f"email-sender-{i}", daemon=True) for i in range(max(1, workers))]
+        for thread in self._threads: thread.start()
+        logging.info(f"Email dispatcher started with {len(self._threads)} sender(s), rate limit: {rate_per_second or 'none'}/s.")
+
+    def submit(self, message: dict):
+        self._queue.put(message)
+
+    def _worker(self):
+        while True:
+            message = self._queue.get()
+            try:
+                if message is None: return
+                if self._bucket: self._bucket.acquire()
+                self._deliver(message)
+            except Exception as e:
+                logging.error(f"Email sender failed to deliver a queued message: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        """Drains the queue, then stops the sender threads."""
+        self.flush()
+        for _ in self._threads: self._queue.put(None)
+        for thread in self._threads: thread.join()
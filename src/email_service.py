@@ -1,52 +1,131 @@
 import base64
 import logging
-import smtplib
+import time
+from datetime import datetime, timedelta
+from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from pathlib import Path
 
-from jinja2 import Environment, FileSystemLoader
-
 from .config import settings
+from .email_dispatcher import EmailDispatcher
+from .smtp_pool import SmtpSessionPool
+from .template_loader import create_environment
 
 class EmailService:
     """
     Handles rendering and sending emails.
-    It also handles embedding local images (header and footer) as Base64 data.
+    It also handles embedding local images (header and footer), either inline as Base64
+    data URIs or as multipart/related CID attachments (EMAIL_IMAGE_MODE).
     """
 
-    def __init__(self):
+    def __init__(self, outbox=None, on_delivered=None):
         self.mode = settings.EMAIL_MODE
         self.sender_email = settings.SENDER_EMAIL
         self.use_test_recipients = self.mode != 'SEND'
         self.test_recipients = settings.TEST_RECIPIENTS
+        # Durable record of each email (see src/outbox.py) and the callback that logs delivered notifications.
+        self.outbox = outbox
+        self.on_delivered = on_delivered
 
         project_root = Path(__file__).parent.parent
-        template_path = project_root / "templates"
         
         self.header_logo_path = project_root / "assets" / "headerlogo.png"
         self.footer_logo_path = project_root / "assets" / "footerlogo.png"
         
-        self.jinja_env = Environment(loader=FileSystemLoader(template_path))
+        # Templates load from precompiled modules or the bytecode cache instead of being re-parsed each run.
+        self.jinja_env = create_environment()
+
+        # Logos are read and encoded once per process rather than on every send.
+        self.image_mode = settings.EMAIL_IMAGE_MODE
+        self.logo_context, self.logo_parts = self._prepare_logos({"header_logo": self.header_logo_path, "footer_logo": self.footer_logo_path})
+
+        # Sessions are opened on the first send and reused until close().
+        self.smtp_pool = SmtpSessionPool(settings.SMTP_HOST, settings.SMTP_PORT, settings.SMTP_USER, settings.SMTP_PASSWORD, size=settings.SMTP_POOL_SIZE, timeout=settings.SMTP_TIMEOUT) if self.mode != "LOG" else None
+
+        # In ASYNC mode send_email() only renders and enqueues; sender threads deliver in the background.
+        self.dispatcher = EmailDispatcher(self._deliver, workers=settings.EMAIL_SENDER_WORKERS, rate_per_second=settings.EMAIL_RATE_PER_SECOND, burst=settings.EMAIL_RATE_BURST) if settings.EMAIL_DISPATCH_MODE == "ASYNC" else None
 
-    def _encode_image_to_base64(self, image_path: Path) -> str | None:
-        """Reads an image file and returns its Base64 encoded string."""
+    def flush(self):
+        """Blocks until every queued email has been delivered, retried out, or marked failed."""
+        if self.dispatcher: self.dispatcher.flush()
+        self.retry_pending()
+
+    def close(self):
+        """Delivers any queued emails, then closes open SMTP sessions. Call once at the end of the run."""
+        if self.dispatcher: self.dispatcher.close()
+        self.retry_pending()
+        if self.smtp_pool: self.smtp_pool.close()
+
+    def _read_image(self, image_path: Path) -> bytes | None:
+        """Reads an image file and returns its bytes."""
         try:
             with open(image_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-            return encoded_string
+                return image_file.read()
         except FileNotFoundError:
             logging.warning(f"Logo image not found at path: {image_path}. Skipping embedding.")
             return None
 
+    def _prepare_logos(self, logo_paths: dict) -> tuple[dict, list]:
+        """
+        Returns the template context for each logo ('<key>_src') and, in CID mode, the MIME image
+        parts to attach. In CID mode each message carries the image bytes once instead of inside the HTML.
+        """
+        logo_context, logo_parts = {}, []
+        for key, image_path in logo_paths.items():
+            image_data = self._read_image(image_path)
+            if image_data is None:
+                logo_context[f"{key}_src"] = None
+            elif self.image_mode == "CID":
+                logo_context[f"{key}_src"] = f"cid:{key}"
+                part = MIMEImage(image_data, "png")
+                part.add_header("Content-ID", f"<{key}>")
+                part.add_header("Content-Disposition", "inline", filename=image_path.name)
+                logo_parts.append(part)
+            else:
+                logo_context[f"{key}_src"] = f"data:image/png;base64,{base64.b64encode(image_data).decode('utf-8')}"
+        return logo_context, logo_parts
+
+    def _build_message(self, subject: str, recipients: list, html_body: str) -> MIMEMultipart:
+        """Builds the MIME message, wrapping it in multipart/related when logos are sent as CID parts."""
+        body = MIMEMultipart("alternative")
+        body.attach(MIMEText(html_body, "html"))
+        if self.logo_parts:
+            msg = MIMEMultipart("related")
+            msg.attach(body)
+            for part in self.logo_parts: msg.attach(part)
+        else:
+            msg = body
+        msg["Subject"] = subject
+        msg["From"] = self.sender_email
+        msg["To"] = ", ".join(recipients)
+        return msg
+
+    def _strip_logos(self, html_body: str) -> str:
+        """
+        Replaces each logo src in a rendered body with a '{{<key>_src}}' placeholder, so the outbox stores the
+        message without the Base64 logos (most of an INLINE email's size). _restore_logos puts them back.
+        """
+        for key, src in self.logo_context.items():
+            if src: html_body = html_body.replace(src, f"{{{{{key}}}}}")
+        return html_body
+
+    def _restore_logos(self, html_body: str) -> str:
+        """Fills the logo placeholders of an outbox body with this process's logo srcs (INLINE or CID)."""
+        for key, src in self.logo_context.items():
+            html_body = html_body.replace(f"{{{{{key}}}}}", src or "")
+        return html_body
+
     def _render_template(self, template_name: str, context: dict) -> str:
         """Renders an HTML template with the given context."""
         template = self.jinja_env.get_template(template_name)
         return template.render(context)
 
-    def send_email(self, recipients: list, subject: str, template_name: str, context: dict):
+    def send_email(self, recipients: list, subject: str, template_name: str, context: dict, notification: dict = None):
         """
         Constructs and sends an email, ensuring recipient list is clean.
+        In ASYNC dispatch mode the rendered email is queued and this returns immediately.
+        `notification` is the eodDelayLogs entry to record once the email has actually been delivered.
         """
         base_recipients = self.test_recipients if self.use_test_recipients else list(set(recipients))
         
@@ -59,33 +138,62 @@ class EmailService:
             return
         # --- MODIFICATION END ---
         
-        header_logo_data = self._encode_image_to_base64(self.header_logo_path)
-        footer_logo_data = self._encode_image_to_base64(self.footer_logo_path)
-        context['header_logo_base64'] = header_logo_data
-        context['footer_logo_base64'] = footer_logo_data
+        context.update(self.logo_context)
         
         html_body = self._render_template(template_name, context)
 
+        message = {"subject": subject, "recipients": final_recipients, "html_body": html_body, "notification": notification}
+        # Outside LOG mode every email is recorded in the outbox first, so a failed send is retried rather than lost.
+        if self.outbox and self.mode != "LOG":
+            message["_id"] = self.outbox.add({**message, "html_body": self._strip_logos(html_body)})
+
+        if self.dispatcher:
+            self.dispatcher.submit(message)
+        else:
+            self._deliver(message)
+
+    def _deliver(self, message: dict):
+        """
+        Logs (MODE=LOG) or sends one rendered email and records the outcome.
+        The notification, if any, is handed to on_delivered only once delivery is confirmed.
+        """
+        subject, final_recipients = message["subject"], message["recipients"]
         if self.mode == "LOG":
             logging.info("--- EMAIL DRY RUN (MODE=LOG) ---")
             logging.info(f"  From: {self.sender_email}")
             logging.info(f"  To: {', '.join(final_recipients)}")
             logging.info(f"  Subject: {subject}")
             logging.info("----------------------------------")
-            return
+        else:
+            try:
+                msg = self._build_message(subject, final_recipients, message["html_body"])
 
-        try:
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = self.sender_email
-            msg["To"] = ", ".join(final_recipients)
-            msg.attach(MIMEText(html_body, "html"))
-
-            with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-                server.starttls()
-                server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-                server.sendmail(self.sender_email, final_recipients, msg.as_string())
-            logging.info(f"Successfully sent email with subject '{subject}' to {', '.join(final_recipients)}")
-
-        except Exception as e:
-            logging.error(f"Failed to send email to {', '.join(final_recipients)}: {e}", exc_info=True)
\ No newline at end of file
+                self.smtp_pool.sendmail(self.sender_email, final_recipients, msg.as_string())
+                logging.info(f"Successfully sent email with subject '{subject}' to {', '.join(final_recipients)}")
+
+            except Exception as e:
+                logging.error(f"Failed to send email to {', '.join(final_recipients)}: {e}", exc_info=True)
+                if message.get("_id") is not None: self.outbox.mark_attempt_failed(message["_id"], str(e))
+                return
+            if message.get("_id") is not None: self.outbox.mark_sent(message["_id"])
+
+        if message.get("notification") and self.on_delivered:
+            self.on_delivered(message["notification"])
+
+    def retry_pending(self):
+        """
+        Re-sends outbox emails that are due, waiting out the exponential backoff between attempts,
+        until each one is delivered or has used OUTBOX_MAX_ATTEMPTS. Also picks up emails left
+        pending by an earlier run that stopped before delivering them.
+        """
+        if not self.outbox or self.mode == "LOG": return
+        expired = self.outbox.expire_stale(datetime.utcnow() - timedelta(hours=settings.OUTBOX_MAX_AGE_HOURS))
+        if expired: logging.warning(f"{expired} outbox email(s) were older than {settings.OUTBOX_MAX_AGE_HOURS}h and were marked failed without sending.")
+        while True:
+            for message in self.outbox.due():
+                message["html_body"] = self._restore_logos(message["html_body"])
+                logging.info(f"Retrying outbox email '{message['subject']}' (attempt {message['attempts'] + 1} of {settings.OUTBOX_MAX_ATTEMPTS}).")
+                self._deliver(message)
+            next_attempt = self.outbox.next_attempt_time()
+            if next_attempt is None: return
+            time.sleep(max(0.0, (next_attempt - datetime.utcnow()).total_seconds()))
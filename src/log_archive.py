@@ -0,0 +1,140 @@
+import json
+import logging
+import re
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+from .config import settings
+
+# LOG_ARCHIVE_CODEC values. ZIP_ZSTANDARD only exists on Python 3.14+, so ZSTD falls back to DEFLATE elsewhere.
+ZIP_CODECS = {"DEFLATE": zipfile.ZIP_DEFLATED, "LZMA": zipfile.ZIP_LZMA, "BZIP2": zipfile.ZIP_BZIP2}
+if hasattr(zipfile, "ZIP_ZSTANDARD"): ZIP_CODECS["ZSTD"] = zipfile.ZIP_ZSTANDARD
+
+# Every archive carries this member: {"members": {member name: {"date", "size", "runs": [{"offset", "started", "script"}]}}}.
+# Offsets are uncompressed byte positions of each script's "--- Starting ... ---" line inside the member.
+INDEX_MEMBER = "_index.json"
+LOG_FILE_PATTERN = "*_eod_monitor.log"
+ARCHIVE_PATTERN = "*_logs_archive_*.zip"
+# Entry scripts log their start banner from main(); monitors log "--- Starting ... ---" too, but from other functions.
+_RUN_START = re.compile(rb"\)\.main\(\d+\) - --- Starting (.+?) ---")
+
+
+def resolve_codec(codec: str = None) -> tuple[str, int]:
+    """Returns (codec name, zipfile compression constant) for LOG_ARCHIVE_CODEC."""
+    codec = (codec or settings.LOG_ARCHIVE_CODEC).upper()
+    if codec not in ZIP_CODECS:
+        logging.warning(f"Log archive codec '{codec}' is not available on this Python. Falling back to DEFLATE.")
+        codec = "DEFLATE"
+    return codec, ZIP_CODECS[codec]
+
+
+def _member_date(name: str) -> str:
+    """'20250915_eod_monitor.log' -> '2025-09-15'."""
+    try:
+        return datetime.strptime(name[:8], "%Y%m%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def index_log_file(path) -> dict:
+    """Index entry for one daily log file: its date, size and the byte offset of every script run in it."""
+    runs, offset = [], 0
+    with open(path, "rb") as f:
+        for line in f:
+            match = _RUN_START.search(line)
+            if match: runs.append({"offset": offset, "started": line[:19].decode("utf-8", "replace"), "script": match.group(1).decode("utf-8", "replace")})
+            offset += len(line)
+    return {"date": _member_date(Path(path).name), "size": offset, "runs": runs}
+
+
+def compress_files(archive_path: str, files: list, compression: int, level: int = None) -> tuple[str, int, int, float]:
+    """
+    Writes `files` into one zip archive and returns (archive_path, raw bytes, compressed bytes, seconds).
+    Runs in a worker process, so it only takes and returns plain values. A partial archive is removed on failure.
+    """
+    started = time.perf_counter()
+    archive_path = Path(archive_path)
+    try:
+        with zipfile.ZipFile(archive_path, "w", compression=compression, compresslevel=level) as zipf:
+            index = {"members": {}}
+            for file in files:
+                zipf.write(file, arcname=Path(file).name)
+                index["members"][Path(file).name] = index_log_file(file)
+            zipf.writestr(INDEX_MEMBER, json.dumps(index, indent=1))
+    except Exception:
+        if archive_path.exists(): archive_path.unlink()
+        raise
+    raw_bytes = sum(Path(file).stat().st_size for file in files)
+    return str(archive_path), raw_bytes, archive_path.stat().st_size, time.perf_counter() - started
+
+
+def branch_line_pattern(branch_code: int, branch_name: str = None):
+    """
+    Matches the log lines about one branch in the formats the monitors write: "branch 12", "branch code 100",
+    "Branch 100 sign-out ...", "Logged notification: sign-out for 14" and, when the name is known, the email
+    subjects that name the branch ("... Pending for Matsapha", "... at Matsapha").
+    """
+    patterns = [rf"\bbranch(?: code)?\s+{branch_code}\b", rf"Logged notification: [\w-]+ for {branch_code}\s*$"]
+    if branch_name: patterns.append(rf"\b(?:for|at) {re.escape(branch_name)}\b")
+    return re.compile("|".join(patterns), re.IGNORECASE)
+
+
+def describe_compression(raw_bytes: int, compressed_bytes: int, seconds: float) -> str:
+    """One-line ratio and throughput summary for the run log."""
+    ratio = raw_bytes / compressed_bytes if compressed_bytes else 0
+    throughput = raw_bytes / (1024 * 1024) / seconds if seconds > 0 else 0
+    return f"{raw_bytes / (1024 * 1024):.1f} MB -> {compressed_bytes / (1024 * 1024):.1f} MB (ratio {ratio:.1f}x, {throughput:.1f} MB/s, {seconds:.1f}s)"
+
+
+def read_index(zipf: zipfile.ZipFile) -> dict:
+    """The archive's index. Archives written before the index existed get one without run offsets."""
+    if INDEX_MEMBER in zipf.namelist(): return json.loads(zipf.read(INDEX_MEMBER))
+    return {"members": {info.filename: {"date": _member_date(info.filename), "size": info.file_size, "runs": []} for info in zipf.infolist()}}
+
+
+def list_days(log_dir: Path) -> list:
+    """[(date, source, runs), ...] for every archived or still-live daily log, where source is an archive name or 'live'."""
+    days = []
+    for archive_path in sorted(Path(log_dir).glob(ARCHIVE_PATTERN)):
+        with zipfile.ZipFile(archive_path) as zipf:
+            days.extend((entry["date"], archive_path.name, entry["runs"]) for entry in read_index(zipf)["members"].values() if entry["date"])
+    for log_file in sorted(Path(log_dir).glob(LOG_FILE_PATTERN)):
+        days.append((_member_date(log_file.name), "live", index_log_file(log_file)["runs"]))
+    return sorted(days)
+
+
+def read_day(log_dir: Path, day: str, run: int = None):
+    """
+    Yields the lines of one day's log, or of only its `run`-th script run (1-based), reading just that day's member.
+    The day is looked up in the live log directory first, then in each archive's index.
+    """
+    log_file = Path(log_dir) / f"{day.replace('-', '')}_eod_monitor.log"
+    if log_file.exists():
+        yield from _read_range(open(log_file, "rb"), index_log_file(log_file), run)
+        return
+    for archive_path in sorted(Path(log_dir).glob(ARCHIVE_PATTERN), reverse=True):
+        with zipfile.ZipFile(archive_path) as zipf:
+            members = read_index(zipf)["members"]
+            member = next((name for name, entry in members.items() if entry["date"] == day), None)
+            if member:
+                yield from _read_range(zipf.open(member), members[member], run)
+                return
+    raise FileNotFoundError(f"No live or archived log found for {day} in {log_dir}.")
+
+
+def _read_range(stream, entry: dict, run: int = None):
+    with stream:
+        start, end = 0, entry["size"]
+        if run is not None:
+            if not 1 <= run <= len(entry["runs"]): raise ValueError(f"Run {run} does not exist; the log for {entry['date']} has {len(entry['runs'])} run(s).")
+            start = entry["runs"][run - 1]["offset"]
+            end = entry["runs"][run]["offset"] if run < len(entry["runs"]) else entry["size"]
+        # Zip members are seekable; seeking forward only decompresses this member up to the run.
+        stream.seek(start)
+        position = start
+        for line in stream:
+            if position >= end: return
+            position += len(line)
+            yield line.decode("utf-8", "replace").rstrip("\n")
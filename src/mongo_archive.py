@@ -0,0 +1,113 @@
+import gzip
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import Path
+
+import bson
+from bson import json_util
+
+from .config import settings
+
+# ARCHIVE_FORMAT values and the file suffix each one writes.
+ARCHIVE_SUFFIXES = {"JSONL": ".jsonl.gz", "BSON": ".bson.gz"}
+_CHUNK_BYTES = 1024 * 1024
+
+
+def archive_suffix(archive_format: str = None) -> str:
+    return ARCHIVE_SUFFIXES[archive_format or settings.ARCHIVE_FORMAT]
+
+
+def _manifest_path(archive_path: Path) -> Path:
+    return archive_path.with_name(archive_path.name + ".manifest.json")
+
+
+def _encode(doc: dict, archive_format: str) -> bytes:
+    if archive_format == "BSON": return bson.encode(doc)
+    return (json_util.dumps(doc, json_options=json_util.CANONICAL_JSON_OPTIONS) + "\n").encode("utf-8")
+
+
+def _decode_stream(stream, archive_format: str):
+    if archive_format == "BSON":
+        yield from bson.decode_file_iter(stream)
+    else:
+        for line in stream: yield json_util.loads(line)
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_BYTES), b""): digest.update(chunk)
+    return digest.hexdigest()
+
+
+def exported_range(query: dict, manifest: dict) -> dict:
+    """`query` narrowed to the _id range covered by an export, so later inserts are never touched."""
+    return {"$and": [query, {"_id": {"$gte": manifest["firstId"], "$lte": manifest["lastId"]}}]}
+
+
+def export_collection(collection, query: dict, archive_path: Path, archive_format: str = None) -> Path:
+    """
+    Streams every document matching `query` in _id order into a gzip archive (canonical extended JSON lines, or
+    concatenated BSON as mongodump writes it), holding at most one cursor batch in memory.
+    Writes <archive>.manifest.json with the document count, _id range and SHA-256 checksums, and returns its path.
+    A partially written archive is removed if the export fails.
+    """
+    archive_format = archive_format or settings.ARCHIVE_FORMAT
+    manifest_path = _manifest_path(archive_path)
+    content_digest, count, first_id, last_id = hashlib.sha256(), 0, None, None
+    try:
+        with gzip.open(archive_path, "wb", compresslevel=settings.ARCHIVE_GZIP_LEVEL) as out:
+            for doc in collection.find(query).sort("_id", 1).batch_size(settings.MAINTENANCE_BATCH_SIZE):
+                data = _encode(doc, archive_format)
+                out.write(data)
+                content_digest.update(data)
+                count += 1
+                first_id = doc["_id"] if first_id is None else first_id
+                last_id = doc["_id"]
+        manifest = {
+            "collection": collection.name, "query": query, "format": archive_format, "archive": archive_path.name,
+            "count": count, "firstId": first_id, "lastId": last_id, "bytes": archive_path.stat().st_size,
+            "sha256": _file_sha256(archive_path), "contentSha256": content_digest.hexdigest(), "createdAt": datetime.utcnow(),
+        }
+        manifest_path.write_text(json_util.dumps(manifest, json_options=json_util.RELAXED_JSON_OPTIONS, indent=2), encoding="utf-8")
+    except Exception:
+        for path in (archive_path, manifest_path):
+            if path.exists(): path.unlink()
+        raise
+    logging.info(f"Exported {count} '{collection.name}' documents to {archive_path} ({manifest['bytes']} bytes).")
+    return manifest_path
+
+
+def verify_archive(manifest_path: Path) -> dict:
+    """Re-reads an archive and checks it against its manifest: file checksum, content checksum and document count."""
+    manifest = json_util.loads(Path(manifest_path).read_text(encoding="utf-8"))
+    archive_path = Path(manifest_path).with_name(manifest["archive"])
+    if _file_sha256(archive_path) != manifest["sha256"]:
+        raise RuntimeError(f"Archive checksum mismatch for {archive_path}.")
+    content_digest, count = hashlib.sha256(), 0
+    with gzip.open(archive_path, "rb") as stream:
+        for doc in _decode_stream(stream, manifest["format"]):
+            content_digest.update(_encode(doc, manifest["format"]))
+            count += 1
+    if count != manifest["count"] or content_digest.hexdigest() != manifest["contentSha256"]:
+        raise RuntimeError(f"Archive {archive_path} does not match its manifest ({count} of {manifest['count']} documents readable).")
+    logging.info(f"Verified archive {archive_path}: {count} documents, sha256 {manifest['sha256']}.")
+    return manifest
+
+
+def purge_exported(collection, query: dict, manifest: dict) -> int:
+    """
+    Deletes the documents recorded in a verified manifest, one _id-range chunk of MAINTENANCE_BATCH_SIZE at a time,
+    so each delete stays short. Refuses to start if the live documents no longer match the manifest count.
+    """
+    if not manifest["count"]: return 0
+    exported = exported_range(query, manifest)
+    live = collection.count_documents(exported)
+    if live != manifest["count"]:
+        raise RuntimeError(f"{live} live documents match the export but the manifest lists {manifest['count']}. Nothing was purged.")
+    deleted = 0
+    while True:
+        ids = [doc["_id"] for doc in collection.find(exported, {"_id": 1}).sort("_id", 1).limit(settings.MAINTENANCE_BATCH_SIZE)]
+        if not ids: return deleted
+        deleted += collection.delete_many({"$and": [exported, {"_id": {"$gte": ids[0], "$lte": ids[-1]}}]}).deleted_count
@@ -0,0 +1,126 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId, json_util
+
+from .config import settings
+
+# Message statuses. A message stays PENDING until it is delivered or runs out of attempts.
+PENDING, SENT, FAILED = "pending", "sent", "failed"
+
+
+def _next_attempt_at(attempts: int) -> datetime:
+    """Exponential backoff: base, 2x base, 4x base, ... seconds after the latest failed attempt."""
+    return datetime.utcnow() + timedelta(seconds=settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def _expire_at() -> datetime:
+    """When a message that has just been sent or marked failed is deleted (OUTBOX_RETENTION_DAYS)."""
+    return datetime.utcnow() + timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+
+
+class MongoOutbox:
+    """
+    Durable outbox of rendered emails, stored in the emailOutbox collection. Every message is tagged with the
+    `source` script that queued it, and only that script retries it, so one run never re-sends another run's alerts.
+    Sent and failed messages get an expireAt, and the TTL index deletes them once OUTBOX_RETENTION_DAYS have passed.
+    """
+
+    def __init__(self, collection, source: str):
+        self.collection = collection
+        self.source = source
+        self.collection.create_index([("source", 1), ("status", 1), ("nextAttemptAt", 1)])
+        self.collection.create_index([("expireAt", 1)], name="expireAt_ttl", expireAfterSeconds=0)
+        # Messages finished before retention was added have no expireAt yet.
+        self.collection.update_many({"expireAt": None, "status": {"$ne": PENDING}}, {"$set": {"expireAt": _expire_at()}})
+
+    def add(self, message: dict):
+        now = datetime.utcnow()
+        return self.collection.insert_one({**message, "source": self.source, "status": PENDING, "attempts": 0, "createdAt": now, "nextAttemptAt": now, "lastError": None}).inserted_id
+
+    def mark_sent(self, message_id):
+        self.collection.update_one({"_id": message_id}, {"$set": {"status": SENT, "sentAt": datetime.utcnow(), "expireAt": _expire_at()}, "$inc": {"attempts": 1}})
+
+    def mark_attempt_failed(self, message_id, error: str):
+        message = self.collection.find_one_and_update({"_id": message_id}, {"$inc": {"attempts": 1}, "$set": {"lastError": error}}, return_document=True)
+        if message["attempts"] >= settings.OUTBOX_MAX_ATTEMPTS:
+            self.collection.update_one({"_id": message_id}, {"$set": {"status": FAILED, "expireAt": _expire_at()}})
+        else:
+            self.collection.update_one({"_id": message_id}, {"$set": {"nextAttemptAt": _next_attempt_at(message["attempts"])}})
+
+    # Expiry is age-based and applies to every source, so messages from a script that no longer runs still expire.
+    def expire_stale(self, created_before: datetime) -> int:
+        return self.collection.update_many({"status": PENDING, "createdAt": {"$lt": created_before}}, {"$set": {"status": FAILED, "lastError": "Expired before delivery.", "expireAt": _expire_at()}}).modified_count
+
+    def due(self) -> list:
+        return list(self.collection.find({"source": self.source, "status": PENDING, "nextAttemptAt": {"$lte": datetime.utcnow()}}).sort("nextAttemptAt", 1))
+
+    def next_attempt_time(self):
+        message = self.collection.find_one({"source": self.source, "status": PENDING}, {"nextAttemptAt": 1}, sort=[("nextAttemptAt", 1)])
+        return message["nextAttemptAt"] if message else None
+
+
+class SqliteOutbox:
+    """
+    Local SQLite stand-in for MongoOutbox, for hosts where the outbox should not live in MongoDB.
+    Sent and failed messages older than OUTBOX_RETENTION_DAYS are deleted each time the outbox is opened.
+    """
+
+    def __init__(self, path: str, source: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.source = source
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS email_outbox (id TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL, created_at TIMESTAMP NOT NULL, next_attempt_at TIMESTAMP NOT NULL, sent_at TIMESTAMP, last_error TEXT, source TEXT)")
+            # Outbox files created before messages were tagged with their source script.
+            if "source" not in {row[1] for row in self._conn.execute("PRAGMA table_info(email_outbox)")}:
+                self._conn.execute("ALTER TABLE email_outbox ADD COLUMN source TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_email_outbox_source_due ON email_outbox (source, status, next_attempt_at)")
+            pruned = self._conn.execute("DELETE FROM email_outbox WHERE status != ? AND created_at < ?", (PENDING, datetime.utcnow() - timedelta(days=settings.OUTBOX_RETENTION_DAYS))).rowcount
+        if pruned: logging.info(f"Deleted {pruned} finished outbox email(s) older than {settings.OUTBOX_RETENTION_DAYS} days.")
+
+    def add(self, message: dict):
+        message_id, now = str(ObjectId()), datetime.utcnow()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO email_outbox VALUES (?, ?, ?, 0, ?, ?, NULL, NULL, ?)", (message_id, json_util.dumps(message), PENDING, now, now, self.source))
+        return message_id
+
+    def mark_sent(self, message_id):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE email_outbox SET status = ?, sent_at = ?, attempts = attempts + 1 WHERE id = ?", (SENT, datetime.utcnow(), message_id))
+
+    def mark_attempt_failed(self, message_id, error: str):
+        with self._lock, self._conn:
+            attempts = self._conn.execute("SELECT attempts FROM email_outbox WHERE id = ?", (message_id,)).fetchone()[0] + 1
+            if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                self._conn.execute("UPDATE email_outbox SET attempts = ?, status = ?, last_error = ? WHERE id = ?", (attempts, FAILED, error, message_id))
+            else:
+                self._conn.execute("UPDATE email_outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?", (attempts, _next_attempt_at(attempts), error, message_id))
+
+    def expire_stale(self, created_before: datetime) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("UPDATE email_outbox SET status = ?, last_error = 'Expired before delivery.' WHERE status = ? AND created_at < ?", (FAILED, PENDING, created_before)).rowcount
+
+    def due(self) -> list:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, payload, attempts FROM email_outbox WHERE source = ? AND status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at", (self.source, PENDING, datetime.utcnow())).fetchall()
+        return [{**json_util.loads(payload), "_id": message_id, "attempts": attempts} for message_id, payload, attempts in rows]
+
+    def next_attempt_time(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_attempt_at) FROM email_outbox WHERE source = ? AND status = ?", (self.source, PENDING)).fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+
+def create_outbox(db, source: str):
+    """Returns the outbox selected by OUTBOX_BACKEND (MONGO, SQLITE or NONE) for the `source` script's messages."""
+    if settings.OUTBOX_BACKEND == "MONGO":
+        return MongoOutbox(db.emailOutbox, source)
+    if settings.OUTBOX_BACKEND == "SQLITE":
+        return SqliteOutbox(settings.OUTBOX_SQLITE_PATH, source)
+    logging.warning("Email outbox is disabled (OUTBOX_BACKEND=NONE). Failed emails will not be retried.")
+    return None
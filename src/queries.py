@@ -0,0 +1,150 @@
+import logging
+import threading
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+# Resolves to the requested run date, or today when :run_date is bound to None.
+# Keeping the date in a bind variable gives Oracle one SQL text per statement, whatever the date.
+RUN_DATE_FILTER = "NVL(TO_DATE(:run_date, 'DD-MON-YYYY'), TRUNC(SYSDATE))"
+
+HEAD_OFFICE_BRANCH_CODE = 100
+
+# --- Row Types ---
+# The only columns the monitors, reports and templates read. Each query's rows are built directly as one of
+# these tuples by the driver's rowfactory; the field names also drive the SELECT list, so adding a column to a
+# template means adding a field here. Rows are immutable: anything derived (e.g. branch names) is looked up
+# by branch code, not stored on the row.
+class SignoutRow(NamedTuple):
+    BRNSTATUS_BRN_CODE: int
+
+class AuthorizationRow(NamedTuple):
+    BOPAUTHQ_TRAN_BRN_CODE: int
+    BOPAUTHQ_SOURCE_KEY_VALUE: str
+    BOPAUTHQ_ENTD_BY: str
+    BOPAUTHQ_AMT_INVOLVED_IN_BC: Optional[float]
+
+# Per-branch aggregate of an authorization queue, computed by the database and shared by alerts and reports.
+class AuthTotals(NamedTuple):
+    count: int
+    amount: float
+
+class UserMapRow(NamedTuple):
+    USER_ID: str
+    USER_DEPT_CODE: str
+
+class CommonAuthRow(NamedTuple):
+    TBAQ_DONE_BRN: int
+    TBAQ_MAIN_PK: str
+    TBAQ_DONE_BY: str
+    TBAQ_PGM_ID: str
+
+class TellerSignoutRow(NamedTuple):
+    CASHSIGN_BRN_CODE: int
+    CASHSIGN_USER_ID: str
+
+# One row per branch from the GROUP BY summary queries.
+class BranchCountRow(NamedTuple):
+    BRANCH_CODE: int
+    ITEM_COUNT: int
+
+class BranchAmountRow(NamedTuple):
+    BRANCH_CODE: int
+    ITEM_COUNT: int
+    TOTAL_AMOUNT: Optional[float]
+
+# --- Column Sets ---
+SIGNOUT_COLUMNS = SignoutRow._fields
+AUTHORIZATION_COLUMNS = AuthorizationRow._fields
+USER_MAP_COLUMNS = UserMapRow._fields
+COMMON_AUTH_COLUMNS = CommonAuthRow._fields
+TELLER_SIGNOUT_COLUMNS = TellerSignoutRow._fields
+
+def _select(columns: tuple, from_clause: str) -> str:
+    return f"SELECT {', '.join(columns)} FROM {from_clause}"
+
+def _count_by_branch(branch_column: str, from_clause: str, amount_column: str = None) -> str:
+    """Per-branch COUNT(*) (and SUM of `amount_column`) over the same rows `_select` would return, aliased to BranchCountRow/BranchAmountRow."""
+    amount = f", SUM({amount_column}) TOTAL_AMOUNT" if amount_column else ""
+    return f"SELECT {branch_column} BRANCH_CODE, COUNT(*) ITEM_COUNT{amount} FROM {from_clause} GROUP BY {branch_column}"
+
+# --- Queues ---
+# The pending rows of each queue. Summary queries aggregate them in the database; detail queries are limited
+# to the branches that are actually alerted, passed as one collection bind so the SQL text never changes.
+BRANCH_CODE_LIST_TYPE = "SYS.ODCINUMBERLIST"
+IN_BRANCH_CODES = "IN (SELECT COLUMN_VALUE FROM TABLE(:branch_codes))"
+BRANCH_AUTH_QUEUE = f"bopauthq WHERE BOPAUTHQ_ENTRY_STATUS = 'N' AND BOPAUTHQ_TRAN_DATE_OF_TRAN = {RUN_DATE_FILTER} AND BOPAUTHQ_TRAN_BRN_CODE != :ho_branch_code"
+COMMON_AUTH_QUEUE = f"TBAAUTHQ t WHERE TRUNC(TBAQ_ENTRY_DATE) = {RUN_DATE_FILTER} AND TBAQ_DONE_BRN IS NOT NULL"
+TELLER_SIGNOUT_QUEUE = f"cashSIGNINOUT WHERE CASHSIGN_DATE = {RUN_DATE_FILTER} AND CASHSIGN_SIGNED_OUT = 0"
+
+# --- Query Catalog ---
+# Every statement the monitors run, by name. The name is reported as the session ACTION
+# in V$SESSION / V$SQL and is the key used for the per-run execution statistics.
+QUERY_ROW_TYPES = {
+    "pending_signouts": SignoutRow,
+    "branch_authorization_totals": BranchAmountRow,
+    "branch_authorizations_for_branches": AuthorizationRow,
+    "head_office_authorizations": AuthorizationRow,
+    "head_office_user_map": UserMapRow,
+    "common_authorization_counts": BranchCountRow,
+    "common_authorizations_for_branches": CommonAuthRow,
+    "teller_signout_counts": BranchCountRow,
+    "teller_signouts_for_branches": TellerSignoutRow,
+}
+
+QUERY_CATALOG = {
+    "pending_signouts": _select(SIGNOUT_COLUMNS, f"brnstatus WHERE BRNSTATUS_STATUS = 'I' AND BRNSTATUS_CURR_DATE = {RUN_DATE_FILTER}"),
+    "branch_authorization_totals": _count_by_branch("BOPAUTHQ_TRAN_BRN_CODE", BRANCH_AUTH_QUEUE, "BOPAUTHQ_AMT_INVOLVED_IN_BC"),
+    "branch_authorizations_for_branches": _select(AUTHORIZATION_COLUMNS, f"{BRANCH_AUTH_QUEUE} AND BOPAUTHQ_TRAN_BRN_CODE {IN_BRANCH_CODES}"),
+    "head_office_authorizations": _select(AUTHORIZATION_COLUMNS, f"bopauthq WHERE BOPAUTHQ_ENTRY_STATUS = 'N' AND BOPAUTHQ_TRAN_DATE_OF_TRAN = {RUN_DATE_FILTER} AND BOPAUTHQ_TRAN_BRN_CODE = :ho_branch_code"),
+    "head_office_user_map": _select(USER_MAP_COLUMNS, "users WHERE USER_BRANCH_CODE = :ho_branch_code"),
+    "common_authorization_counts": _count_by_branch("TBAQ_DONE_BRN", COMMON_AUTH_QUEUE),
+    "common_authorizations_for_branches": _select(COMMON_AUTH_COLUMNS, f"{COMMON_AUTH_QUEUE} AND TBAQ_DONE_BRN {IN_BRANCH_CODES}"),
+    "teller_signout_counts": _count_by_branch("CASHSIGN_BRN_CODE", TELLER_SIGNOUT_QUEUE),
+    "teller_signouts_for_branches": _select(TELLER_SIGNOUT_COLUMNS, f"{TELLER_SIGNOUT_QUEUE} AND CASHSIGN_BRN_CODE {IN_BRANCH_CODES}"),
+}
+
+# Opens the snapshot's transaction; every query in it then sees the database as of this statement.
+READ_ONLY_TRANSACTION = "SET TRANSACTION READ ONLY"
+
+# --- Fetch Sizes ---
+# (arraysize, prefetchrows) per statement. Rows are streamed in batches of arraysize, so large queues
+# such as bopauthq use big batches to save round trips, while one-row-per-branch queries stay small.
+# The first batch of prefetchrows comes back with the execute itself. ORACLE_FETCH_SIZES overrides any entry.
+QUERY_FETCH_SIZES = {
+    "pending_signouts": (100, 100),
+    "branch_authorization_totals": (200, 200),
+    "branch_authorizations_for_branches": (1000, 1000),
+    "head_office_authorizations": (1000, 1000),
+    "head_office_user_map": (500, 500),
+    "common_authorization_counts": (200, 200),
+    "common_authorizations_for_branches": (1000, 1000),
+    "teller_signout_counts": (200, 200),
+    "teller_signouts_for_branches": (200, 200),
+}
+
+# The queue summaries read as a snapshot opens (see DataManager.queue_snapshot). Only these are kept for the rest of
+# the snapshot; per-branch detail is streamed on the snapshot connection each time it is asked for.
+SNAPSHOT_CACHED_QUERIES = ("pending_signouts", "branch_authorization_totals", "teller_signout_counts", "common_authorization_counts")
+
+# Cumulative server-side parse/execute counts for the catalog, grouped by the ACTION set on each session.
+PARSE_STATS_QUERY = "SELECT action, SUM(parse_calls), SUM(executions) FROM v$sql WHERE module = :module GROUP BY action ORDER BY action"
+
+
+class QueryStats:
+    """Thread-safe per-run execution counters for the statements in QUERY_CATALOG."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"executions": 0, "rows": 0, "seconds": 0.0})
+
+    def record(self, query_name: str, rows: int, seconds: float):
+        with self._lock:
+            entry = self._stats[query_name]
+            entry["executions"] += 1
+            entry["rows"] += rows
+            entry["seconds"] += seconds
+
+    def log_summary(self):
+        with self._lock:
+            for query_name, entry in sorted(self._stats.items()):
+                logging.info(f"Query '{query_name}': {entry['executions']} executions, {entry['rows']} rows, {entry['seconds']:.3f}s")
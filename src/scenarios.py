@@ -4,30 +4,36 @@ from datetime import datetime
 
 from .data_manager import DataManager
 from .email_service import EmailService
+from .weekly_trends import build_weekly_trends
 from .config import settings
 
+def _delay_log_entry(delay_type: str, group_name: str, recipients: list, branch_id: int, department_id: str = None):
+    """Builds the eodDelayLogs entry for an alert, storing the group name resolved at write time."""
+    return {"timestamp": datetime.utcnow(), "delayType": delay_type, "branchId": branch_id, "departmentId": department_id, "groupName": group_name or "Unknown", "groupType": "department" if department_id else "branch", "notificationSentTo": recipients}
+
+
+def _alerted_branch_codes(branches, branch_codes) -> list:
+    """The codes among `branch_codes` whose branch has supervisors to alert; only these need row detail."""
+    return [code for code in branch_codes if (branches.get(code) or {}).get("supervisorEmails")]
+
+
 def _monitor_branch_signouts(data_manager: DataManager, email_service: EmailService):
-    """Monitors and sends TARGETED alerts for branch signouts, then returns the pending data."""
-    pending_branches = data_manager.get_pending_signouts()
+    """Monitors and sends TARGETED alerts for branch signouts, then returns {branch_code: branch_name} for the pending branches."""
+    branches = data_manager.get_branch_directory()
+    # One row per branch, so the stream is grouped as it is read.
+    pending_branches = {row.BRNSTATUS_BRN_CODE: branches.name_for(row.BRNSTATUS_BRN_CODE) for row in data_manager.iter_pending_signouts()}
     if not pending_branches:
         logging.info("Branch Signouts: No pending items found.")
-        return []
-
-    # Enrich data with branch names for the consolidated report
-    for record in pending_branches:
-        config = data_manager.get_branch_config(record["BRNSTATUS_BRN_CODE"])
-        record['branch_name'] = config.get("name", "Unknown Branch") if config else "Unknown Branch"
-
-    for branch_record in pending_branches:
-        branch_code = branch_record["BRNSTATUS_BRN_CODE"]
+        return {}
 
+    for branch_code, branch_name in pending_branches.items():
         # --- MODIFICATION: Exclude Branch 100 from all sign-out notifications ---
         if branch_code == 100:
             logging.info(f"Branch 100 sign-out is pending but is excluded from notifications per business rules.")
             continue
         # --- END MODIFICATION ---
 
-        branch_config = data_manager.get_branch_config(branch_code)
+        branch_config = branches.get(branch_code)
         if not branch_config: continue
         
         recipients = branch_config.get("supervisorEmails", [])
@@ -35,126 +41,105 @@ def _monitor_branch_signouts(data_manager: DataManager, email_service: EmailServ
             logging.warning(f"No supervisors for branch {branch_code}. Cannot send targeted sign-out alert.")
             continue
 
-        subject = f"Action Required: EOD Branch Sign-out Pending for {branch_record['branch_name']}"
+        subject = f"Action Required: EOD Branch Sign-out Pending for {branch_name}"
         now = datetime.now()
-        context = {"branch_name": branch_record['branch_name'], "current_date": now.strftime('%d-%b-%Y'), "timestamp": now.strftime('%Y-%m-%d %H:%M:%S')}
-        email_service.send_email(recipients, subject, "branch_signout_alert.html", context)
-        data_manager.log_notification({"timestamp": datetime.utcnow(), "delayType": "sign-out", "branchId": branch_code, "departmentId": None, "notificationSentTo": recipients})
+        context = {"branch_name": branch_name, "current_date": now.strftime('%d-%b-%Y'), "timestamp": now.strftime('%Y-%m-%d %H:%M:%S')}
+        email_service.send_email(recipients, subject, "branch_signout_alert.html", context, notification=_delay_log_entry("sign-out", branch_config.get("name"), recipients, branch_code))
     
     # Still return all data so it appears on the consolidated report, even if no alert was sent for Branch 100
     return pending_branches
 
 
 def _monitor_branch_authorizations(data_manager: DataManager, email_service: EmailService):
-    """Monitors and sends TARGETED alerts for branch financial auths, then returns the pending data."""
-    pending_txns = data_manager.get_branch_authorizations()
-    if not pending_txns:
+    """Monitors and sends TARGETED alerts for branch financial auths, then returns {branch_code: AuthTotals} for the pending branches."""
+    totals = data_manager.get_branch_authorization_totals()
+    if not totals:
         logging.info("Branch Financial Auths: No pending items found.")
-        return []
-    for txn in pending_txns:
-        config = data_manager.get_branch_config(txn["BOPAUTHQ_TRAN_BRN_CODE"])
-        txn['branch_name'] = config.get("name", "Unknown Branch") if config else "Unknown Branch"
-    grouped_txns = defaultdict(list)
-    for txn in pending_txns: grouped_txns[txn["BOPAUTHQ_TRAN_BRN_CODE"]].append(txn)
+        return {}
+    branches = data_manager.get_branch_directory()
+    # Row detail for every alerted branch comes back in one query, with per-branch totals computed from those rows,
+    # so the alert header always agrees with its table even if the queue moved since the summary.
+    grouped_txns, alert_totals = data_manager.group_branch_authorizations_for(_alerted_branch_codes(branches, totals))
+    # The consolidated report uses the same figures the alerts were built from.
+    totals.update(alert_totals)
     for branch_code, transactions in grouped_txns.items():
-        branch_config = data_manager.get_branch_config(branch_code)
-        if not branch_config: continue
+        branch_config = branches.get(branch_code)
         recipients = branch_config.get("supervisorEmails", [])
-        if not recipients: continue
-        context = {"group_name": branch_config.get('name'), "transactions": transactions, "total_pending": len(transactions), "total_amount": f"{sum(t.get('BOPAUTHQ_AMT_INVOLVED_IN_BC') or 0 for t in transactions):,.2f}", "current_date": datetime.now().strftime('%d-%b-%Y'), "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        email_service.send_email(recipients, f"Urgent Action: Pending Transaction Authorizations for {branch_config.get('name')}", "transaction_auth_alert.html", context)
-        data_manager.log_notification({"timestamp": datetime.utcnow(), "delayType": "authorization", "branchId": branch_code, "departmentId": None, "notificationSentTo": recipients})
-    return pending_txns
+        context = {"group_name": branch_config.get('name'), "transactions": transactions, "total_pending": alert_totals[branch_code].count, "total_amount": f"{alert_totals[branch_code].amount:,.2f}", "current_date": datetime.now().strftime('%d-%b-%Y'), "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        email_service.send_email(recipients, f"Urgent Action: Pending Transaction Authorizations for {branch_config.get('name')}", "transaction_auth_alert.html", context, notification=_delay_log_entry("authorization", branch_config.get("name"), recipients, branch_code))
+    return totals
 
 
 # def _monitor_head_office_authorizations(data_manager: DataManager, email_service: EmailService):
-#     """Monitors and sends TARGETED alerts for HO financial auths, then returns the ENRICHED pending data."""
-#     pending_txns = data_manager.get_head_office_authorizations()
-#     if not pending_txns:
-#         logging.info("Head Office Financial Auths: No pending items found.")
-#         return []
+#     """Monitors and sends TARGETED alerts for HO financial auths, then returns the pending transactions grouped by department ID."""
 #     user_to_dept_code_map = data_manager.get_head_office_user_map()
 #     dept_code_to_id_map = {"12": "CREDIT", "5": "FINANCE", "01": "RISK"}
 #     grouped_txns = defaultdict(list)
-#     for txn in pending_txns:
-#         user_id = txn["BOPAUTHQ_ENTD_BY"]
-#         dept_code = user_to_dept_code_map.get(user_id)
+#     for txn in data_manager.iter_head_office_authorizations():
+#         dept_code = user_to_dept_code_map.get(txn.BOPAUTHQ_ENTD_BY)
 #         department_id = dept_code_to_id_map.get(str(dept_code)) if dept_code else None
-#         if department_id:
-#             config = data_manager.get_department_by_id(department_id)
-#             txn['department_name'] = config.get("name", "Unknown Dept") if config else "Unknown Dept"
-#             grouped_txns[department_id].append(txn)
+#         if department_id: grouped_txns[department_id].append(txn)
+#     if not grouped_txns:
+#         logging.info("Head Office Financial Auths: No pending items found.")
+#         return {}
 #     for department_id, transactions in grouped_txns.items():
 #         dept_config = data_manager.get_department_by_id(department_id)
 #         if not dept_config: continue
 #         recipients = dept_config.get("supervisorEmails", []) + dept_config.get("managerEmails", [])
 #         if not recipients: continue
-#         context = {"group_name": dept_config.get("name"), "transactions": transactions, "total_pending": len(transactions), "total_amount": f"{sum(t.get('BOPAUTHQ_AMT_INVOLVED_IN_BC') or 0 for t in transactions):,.2f}", "current_date": datetime.now().strftime('%d-%b-%Y'), "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-#         email_service.send_email(recipients, f"Urgent Action: Pending Head Office Authorizations for {dept_config.get('name')}", "transaction_auth_alert.html", context)
-#         data_manager.log_notification({"timestamp": datetime.utcnow(), "delayType": "authorization", "branchId": 100, "departmentId": department_id, "notificationSentTo": recipients})
-#     enriched_transactions = [txn for txns_list in grouped_txns.values() for txn in txns_list]
-#     return enriched_transactions
+#         context = {"group_name": dept_config.get("name"), "transactions": transactions, "total_pending": len(transactions), "total_amount": f"{sum(t.BOPAUTHQ_AMT_INVOLVED_IN_BC or 0 for t in transactions):,.2f}", "current_date": datetime.now().strftime('%d-%b-%Y'), "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+#         email_service.send_email(recipients, f"Urgent Action: Pending Head Office Authorizations for {dept_config.get('name')}", "transaction_auth_alert.html", context, notification=_delay_log_entry("authorization", dept_config.get("name"), recipients, 100, department_id))
+#     return grouped_txns
 
 
 def _monitor_teller_signouts(data_manager: DataManager, email_service: EmailService):
-    """Monitors and sends TARGETED alerts for teller signouts, then returns the pending data."""
-    pending_tellers = data_manager.get_pending_teller_signouts()
-    if not pending_tellers:
+    """Monitors and sends TARGETED alerts for teller signouts, then returns {branch_code: pending teller count}."""
+    teller_counts = data_manager.get_teller_signout_counts()
+    if not teller_counts:
         logging.info("Teller Signouts: No pending items found.")
-        return []
-    for teller in pending_tellers:
-        config = data_manager.get_branch_config(teller['CASHSIGN_BRN_CODE'])
-        teller['branch_name'] = config.get("name", "Unknown Branch") if config else "Unknown Branch"
+        return {}
+    branches = data_manager.get_branch_directory()
     grouped_by_branch = defaultdict(list)
-    for teller in pending_tellers: 
-        grouped_by_branch[teller['CASHSIGN_BRN_CODE']].append(teller['CASHSIGN_USER_ID'])
+    for teller in data_manager.iter_teller_signouts_for(_alerted_branch_codes(branches, teller_counts)):
+        grouped_by_branch[teller.CASHSIGN_BRN_CODE].append(teller.CASHSIGN_USER_ID)
     for branch_code, teller_ids in grouped_by_branch.items():
-        branch_config = data_manager.get_branch_config(branch_code)
-        if not branch_config: continue
+        branch_config = branches.get(branch_code)
         recipients = branch_config.get("supervisorEmails", [])
-        if not recipients: continue
         context = {"branch_name": branch_config.get("name"), "teller_ids": teller_ids, "current_date": datetime.now().strftime('%d-%b-%Y'), "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        email_service.send_email(recipients, f"Action Required: Pending Teller Sign-outs at {branch_config.get('name')}", "teller_signout_alert.html", context)
-        data_manager.log_notification({"timestamp": datetime.utcnow(), "delayType": "teller-sign-out", "branchId": branch_code, "departmentId": None, "notificationSentTo": recipients})
-    return pending_tellers
+        email_service.send_email(recipients, f"Action Required: Pending Teller Sign-outs at {branch_config.get('name')}", "teller_signout_alert.html", context, notification=_delay_log_entry("teller-sign-out", branch_config.get("name"), recipients, branch_code))
+    return teller_counts
 
 
 def _monitor_common_authorizations(data_manager: DataManager, email_service: EmailService):
-    """Monitors and sends TARGETED alerts for common auths, then returns all pending data."""
-    pending_items = data_manager.get_pending_common_authorizations()
-    if not pending_items:
-        logging.info("Common Auths: No pending items found.")
-        return ({}, {})
+    """Monitors and sends TARGETED alerts for common auths, then returns ({branch_code: pending count}, HO items by department)."""
+    branch_counts, ho_groups = data_manager.get_common_authorization_counts(), defaultdict(list)
     # user_to_dept_code_map = data_manager.get_head_office_user_map()
     # dept_code_to_id_map = {"12": "CREDIT", "5": "FINANCE"}
-    branch_groups, ho_groups = defaultdict(list), defaultdict(list)
-    for item in pending_items:
-        branch_code = item.get('TBAQ_DONE_BRN')
-        # if branch_code == 100:
-        #     user_id = item.get('TBAQ_DONE_BY')
-        #     dept_code = user_to_dept_code_map.get(user_id)
-        #     department_id = dept_code_to_id_map.get(str(dept_code)) if dept_code else None
-        #     if department_id: ho_groups[department_id].append(item)
-        #elif
-        if branch_code:
-            branch_groups[branch_code].append(item)
+    # if branch_counts.pop(100, None):
+    #     for item in data_manager.iter_common_authorizations_for([100]):
+    #         dept_code = user_to_dept_code_map.get(item.TBAQ_DONE_BY)
+    #         department_id = dept_code_to_id_map.get(str(dept_code)) if dept_code else None
+    #         if department_id: ho_groups[department_id].append(item)
+    if not branch_counts and not ho_groups:
+        logging.info("Common Auths: No pending items found.")
+        return ({}, {})
+    branches = data_manager.get_branch_directory()
+    branch_groups = defaultdict(list)
+    for item in data_manager.iter_common_authorizations_for(_alerted_branch_codes(branches, branch_counts)):
+        branch_groups[item.TBAQ_DONE_BRN].append(item)
     for branch_code, items in branch_groups.items():
-        branch_config = data_manager.get_branch_config(branch_code)
-        if not branch_config: continue
+        branch_config = branches.get(branch_code)
         recipients = branch_config.get("supervisorEmails", [])
-        if not recipients: continue
         context = {"group_name": branch_config.get("name"), "items": items, "current_date": datetime.now().strftime('%d-%b-%Y'), "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        email_service.send_email(recipients, f"Action Required: Pending Common Authorizations for {branch_config.get('name')}", "common_auth_alert.html", context)
-        data_manager.log_notification({"timestamp": datetime.utcnow(), "delayType": "common-auth", "branchId": branch_code, "departmentId": None, "notificationSentTo": recipients})
+        email_service.send_email(recipients, f"Action Required: Pending Common Authorizations for {branch_config.get('name')}", "common_auth_alert.html", context, notification=_delay_log_entry("common-auth", branch_config.get("name"), recipients, branch_code))
     for department_id, items in ho_groups.items():
         dept_config = data_manager.get_department_by_id(department_id)
         if not dept_config: continue
         recipients = dept_config.get("supervisorEmails", []) + dept_config.get("managerEmails", [])
         if not recipients: continue
         context = {"group_name": dept_config.get("name"), "items": items, "current_date": datetime.now().strftime('%d-%b-%Y'), "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        email_service.send_email(recipients, f"Action Required: Pending Common Authorizations for {dept_config.get('name')}", "common_auth_alert.html", context)
-        data_manager.log_notification({"timestamp": datetime.utcnow(), "delayType": "common-auth", "branchId": 100, "departmentId": department_id, "notificationSentTo": recipients})
-    return (branch_groups, ho_groups)
+        email_service.send_email(recipients, f"Action Required: Pending Common Authorizations for {dept_config.get('name')}", "common_auth_alert.html", context, notification=_delay_log_entry("common-auth", dept_config.get("name"), recipients, 100, department_id))
+    return (branch_counts, ho_groups)
 
 
 def _send_all_consolidated_reports(data_manager: DataManager, email_service: EmailService, context: dict):
@@ -188,39 +173,45 @@ def _send_all_consolidated_reports(data_manager: DataManager, email_service: Ema
     finance_sups = data_manager.get_system_setting(settings.FINANCE_SUPERVISORS_KEY) or []
 
     # --- Prepare Branch Report ---
+    # Monitor results are per-branch aggregates computed by the database, so the branch report has one
+    # summary line per branch and type; row detail only goes out in the branches' own alerts.
+    branches = data_manager.get_branch_directory()
     branch_incidents = []
-    for item in context.get('branch_signouts', []):
-        if item['BRNSTATUS_BRN_CODE'] != 100: branch_incidents.append({'group_name': item['branch_name'], 'branch_code': item['BRNSTATUS_BRN_CODE'], 'type': 'Branch Sign-out', 'details': f"Branch sign-out is pending."})
-    for item in context.get('teller_signouts', []): branch_incidents.append({'group_name': item['branch_name'], 'branch_code': item['CASHSIGN_BRN_CODE'], 'type': 'Teller Sign-out', 'details': f"Teller ID: {item['CASHSIGN_USER_ID']}"})
-    for item in context.get('branch_auths', []): branch_incidents.append({'group_name': item['branch_name'], 'branch_code': item['BOPAUTHQ_TRAN_BRN_CODE'], 'type': 'Financial Auth', 'details': f"Ref: {item['BOPAUTHQ_SOURCE_KEY_VALUE']} by {item['BOPAUTHQ_ENTD_BY']}"})
-    for branch_code, items in context.get('branch_common_auths', {}).items():
-        config = data_manager.get_branch_config(branch_code); name = config.get("name", "Unknown Branch") if config else "Unknown Branch"
-        for item in items: branch_incidents.append({'group_name': name, 'branch_code': branch_code, 'type': 'Common Auth', 'details': f"Ref: {item['TBAQ_MAIN_PK']} by {item['TBAQ_DONE_BY']}"})
-    branch_metrics = {'total_branch_signouts': len([i for i in branch_incidents if i['type']=='Branch Sign-out']), 'total_teller_signouts': len(context.get('teller_signouts', [])), 'total_financial_value': f"{sum(t.get('BOPAUTHQ_AMT_INVOLVED_IN_BC') or 0 for t in context.get('branch_auths', [])):,.2f}", 'total_common_auths': sum(len(v) for v in context.get('branch_common_auths', {}).values())}
+    for branch_code, branch_name in context.get('branch_signouts', {}).items():
+        if branch_code != 100: branch_incidents.append({'group_name': branch_name, 'branch_code': branch_code, 'type': 'Branch Sign-out', 'details': f"Branch sign-out is pending."})
+    for branch_code, count in context.get('teller_signouts', {}).items():
+        branch_incidents.append({'group_name': branches.name_for(branch_code), 'branch_code': branch_code, 'type': 'Teller Sign-out', 'details': f"{count} teller(s) not signed out."})
+    for branch_code, totals in context.get('branch_auths', {}).items():
+        branch_incidents.append({'group_name': branches.name_for(branch_code), 'branch_code': branch_code, 'type': 'Financial Auth', 'details': f"{totals.count} pending, total {totals.amount:,.2f}"})
+    for branch_code, count in context.get('branch_common_auths', {}).items():
+        branch_incidents.append({'group_name': branches.name_for(branch_code), 'branch_code': branch_code, 'type': 'Common Auth', 'details': f"{count} pending."})
+    branch_metrics = {'total_branch_signouts': len([i for i in branch_incidents if i['type']=='Branch Sign-out']), 'total_teller_signouts': sum(context.get('teller_signouts', {}).values()), 'total_financial_value': f"{sum(t.amount for t in context.get('branch_auths', {}).values()):,.2f}", 'total_common_auths': sum(context.get('branch_common_auths', {}).values())}
     branch_recipients = list(set(it_monitoring + branch_distro))
     generate_and_send_report("Branch Operations Report", branch_incidents, branch_recipients, branch_metrics)
 
     # --- Prepare Credit Report ---
     credit_incidents = []
-    for item in context.get('ho_auths', []):
-        if item.get('department_name', '').startswith('Credit'): credit_incidents.append({'group_name': item['department_name'], 'branch_code': 100, 'type': 'Financial Auth', 'details': f"Ref: {item['BOPAUTHQ_SOURCE_KEY_VALUE']} by {item['BOPAUTHQ_ENTD_BY']}"})
+    if context.get('ho_auths', {}).get('CREDIT'):
+        config = data_manager.get_department_by_id('CREDIT'); name = config.get("name", "Unknown Dept") if config else "Unknown Dept"
+        for item in context['ho_auths']['CREDIT']: credit_incidents.append({'group_name': name, 'branch_code': 100, 'type': 'Financial Auth', 'details': f"Ref: {item.BOPAUTHQ_SOURCE_KEY_VALUE} by {item.BOPAUTHQ_ENTD_BY}"})
     for dept_id, items in context.get('ho_common_auths', {}).items():
         if dept_id == 'CREDIT':
             config = data_manager.get_department_by_id(dept_id); name = config.get("name", "Unknown") if config else "Unknown"
-            for item in items: credit_incidents.append({'group_name': name, 'branch_code': 100, 'type': 'Common Auth', 'details': f"Ref: {item['TBAQ_MAIN_PK']} by {item['TBAQ_DONE_BY']}"})
-    credit_metrics = {'total_branch_signouts': 0, 'total_teller_signouts': 0, 'total_financial_value': f"{sum(t.get('BOPAUTHQ_AMT_INVOLVED_IN_BC') or 0 for t in context.get('ho_auths', []) if t.get('department_name', '').startswith('Credit')):,.2f}", 'total_common_auths': len(context.get('ho_common_auths', {}).get('CREDIT', []))}
+            for item in items: credit_incidents.append({'group_name': name, 'branch_code': 100, 'type': 'Common Auth', 'details': f"Ref: {item.TBAQ_MAIN_PK} by {item.TBAQ_DONE_BY}"})
+    credit_metrics = {'total_branch_signouts': 0, 'total_teller_signouts': 0, 'total_financial_value': f"{sum(t.BOPAUTHQ_AMT_INVOLVED_IN_BC or 0 for t in context.get('ho_auths', {}).get('CREDIT', [])):,.2f}", 'total_common_auths': len(context.get('ho_common_auths', {}).get('CREDIT', []))}
     credit_recipients = list(set(it_monitoring + credit_sups))
     generate_and_send_report("Credit Department Report", credit_incidents, credit_recipients, credit_metrics)
 
     # --- Prepare Finance Report ---
     finance_incidents = []
-    for item in context.get('ho_auths', []):
-        if item.get('department_name', '').startswith('Finance'): finance_incidents.append({'group_name': item['department_name'], 'branch_code': 100, 'type': 'Financial Auth', 'details': f"Ref: {item['BOPAUTHQ_SOURCE_KEY_VALUE']} by {item['BOPAUTHQ_ENTD_BY']}"})
+    if context.get('ho_auths', {}).get('FINANCE'):
+        config = data_manager.get_department_by_id('FINANCE'); name = config.get("name", "Unknown Dept") if config else "Unknown Dept"
+        for item in context['ho_auths']['FINANCE']: finance_incidents.append({'group_name': name, 'branch_code': 100, 'type': 'Financial Auth', 'details': f"Ref: {item.BOPAUTHQ_SOURCE_KEY_VALUE} by {item.BOPAUTHQ_ENTD_BY}"})
     for dept_id, items in context.get('ho_common_auths', {}).items():
         if dept_id == 'FINANCE':
             config = data_manager.get_department_by_id(dept_id); name = config.get("name", "Unknown") if config else "Unknown"
-            for item in items: finance_incidents.append({'group_name': name, 'branch_code': 100, 'type': 'Common Auth', 'details': f"Ref: {item['TBAQ_MAIN_PK']} by {item['TBAQ_DONE_BY']}"})
-    finance_metrics = {'total_branch_signouts': 0, 'total_teller_signouts': 0, 'total_financial_value': f"{sum(t.get('BOPAUTHQ_AMT_INVOLVED_IN_BC') or 0 for t in context.get('ho_auths', []) if t.get('department_name', '').startswith('Finance')):,.2f}", 'total_common_auths': len(context.get('ho_common_auths', {}).get('FINANCE', []))}
+            for item in items: finance_incidents.append({'group_name': name, 'branch_code': 100, 'type': 'Common Auth', 'details': f"Ref: {item.TBAQ_MAIN_PK} by {item.TBAQ_DONE_BY}"})
+    finance_metrics = {'total_branch_signouts': 0, 'total_teller_signouts': 0, 'total_financial_value': f"{sum(t.BOPAUTHQ_AMT_INVOLVED_IN_BC or 0 for t in context.get('ho_auths', {}).get('FINANCE', [])):,.2f}", 'total_common_auths': len(context.get('ho_common_auths', {}).get('FINANCE', []))}
     finance_recipients = list(set(it_monitoring + finance_sups))
     generate_and_send_report("Finance Department Report", finance_incidents, finance_recipients, finance_metrics)
 
@@ -228,8 +219,11 @@ def _send_all_consolidated_reports(data_manager: DataManager, email_service: Ema
 def run_weekly_report(data_manager: DataManager, email_service: EmailService):
     """Scenario 3: Weekly Summary Report."""
     logging.info("Generating weekly EOD delay summary report.")
-    report_data = data_manager.get_weekly_delay_stats()
+    report_data = data_manager.get_weekly_delay_stats(trend_weeks=settings.WEEKLY_TREND_WEEKS)
     if not report_data or not report_data.get("metrics"): return
+    # The data layer returns the raw per-week history; the sparkline series are presentation, built here.
+    history = report_data.pop("history", [])
+    report_data["trends"] = build_weekly_trends(history) if history else None
     it_monitoring = data_manager.get_system_setting(settings.IT_CORE_MONITORING_KEY) or []
     senior_management = data_manager.get_system_setting(settings.SENIOR_MANAGEMENT_KEY) or []
     branch_distro = data_manager.get_system_setting(settings.BRANCH_DISTRIBUTION_CHANNELS_KEY) or []
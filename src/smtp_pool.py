@@ -0,0 +1,93 @@
+import logging
+import queue
+import smtplib
+import threading
+
+# Errors that mean the relay has dropped or is closing the session, so a fresh connection is worth one retry.
+_RECONNECT_CODES = {421}
+
+
+class SmtpSessionPool:
+    """
+    Keeps authenticated SMTP sessions open for the whole run.
+    Each message then costs a single MAIL/RCPT/DATA exchange instead of connect + STARTTLS + login.
+    At most `size` sessions are open at once; dropped sessions are replaced transparently.
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str, size: int = 1, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.starttls()
+            server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        logging.info(f"Opened SMTP session to {self.host}:{self.port}.")
+        return server
+
+    @staticmethod
+    def _discard(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _checkout(self) -> smtplib.SMTP:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def sendmail(self, sender: str, recipients: list, message: str):
+        """Sends one message on a pooled session, reconnecting once if the relay dropped it."""
+        if self._closed:
+            raise RuntimeError("SMTP session pool is closed.")
+        with self._slots:
+            server = self._checkout()
+            try:
+                try:
+                    server.sendmail(sender, recipients, message)
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException) as e:
+                    if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code not in _RECONNECT_CODES:
+                        raise
+                    logging.warning(f"SMTP session was dropped ({e}). Reconnecting and retrying once.")
+                    self._discard(server)
+                    server = None
+                    server = self._connect()
+                    server.sendmail(sender, recipients, message)
+            except Exception:
+                # Leave a live session in a known state for the next message, or drop it if that fails too.
+                # Either way the caller sees the original error, not one from the cleanup.
+                if server is not None:
+                    try:
+                        server.rset()
+                    except Exception:
+                        self._discard(server)
+                    else:
+                        self._idle.put(server)
+                raise
+            self._idle.put(server)
+
+    def close(self):
+        """Closes every open session. Safe to call more than once."""
+        self._closed = True
+        closed = 0
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(server)
+            closed += 1
+        if closed:
+            logging.info(f"Closed {closed} SMTP session(s).")
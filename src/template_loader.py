@@ -0,0 +1,61 @@
+import logging
+from pathlib import Path
+
+from jinja2 import BaseLoader, Environment, FileSystemBytecodeCache, FileSystemLoader, ModuleLoader
+
+from .config import settings
+
+TEMPLATE_PATH = Path(__file__).parent.parent / "templates"
+
+
+def _cache_paths() -> tuple[Path, Path]:
+    cache_dir = Path(settings.TEMPLATE_CACHE_DIR)
+    return cache_dir / "bytecode", cache_dir / "compiled"
+
+
+class _PrecompiledLoader(BaseLoader):
+    """
+    Serves each template from the module written by precompile_templates() when that module is
+    at least as new as the template file (by mtime), and from the source file otherwise.
+    Source loads still go through the environment's bytecode cache.
+    """
+
+    def __init__(self, template_path: Path, compiled_path: Path):
+        self.template_path = Path(template_path)
+        self.compiled_path = Path(compiled_path)
+        self.fs_loader = FileSystemLoader(self.template_path)
+        self.module_loader = ModuleLoader(self.compiled_path) if self.compiled_path.is_dir() else None
+
+    def get_source(self, environment, template):
+        return self.fs_loader.get_source(environment, template)
+
+    def list_templates(self):
+        return self.fs_loader.list_templates()
+
+    def _is_fresh(self, name: str) -> bool:
+        compiled_file = self.compiled_path / ModuleLoader.get_module_filename(name)
+        try:
+            return compiled_file.stat().st_mtime >= (self.template_path / name).stat().st_mtime
+        except FileNotFoundError:
+            return False
+
+    def load(self, environment, name, globals=None):
+        if self.module_loader and self._is_fresh(name):
+            return self.module_loader.load(environment, name, globals)
+        return self.fs_loader.load(environment, name, globals)
+
+
+def create_environment() -> Environment:
+    """Builds the Jinja2 environment used for all emails, backed by the on-disk template caches."""
+    bytecode_path, compiled_path = _cache_paths()
+    bytecode_path.mkdir(parents=True, exist_ok=True)
+    return Environment(loader=_PrecompiledLoader(TEMPLATE_PATH, compiled_path), bytecode_cache=FileSystemBytecodeCache(str(bytecode_path)))
+
+
+def precompile_templates():
+    """Compiles every template into an importable module under TEMPLATE_CACHE_DIR/compiled."""
+    _, compiled_path = _cache_paths()
+    compiled_path.mkdir(parents=True, exist_ok=True)
+    environment = Environment(loader=FileSystemLoader(TEMPLATE_PATH))
+    environment.compile_templates(str(compiled_path), zip=None, log_function=logging.info, ignore_errors=False)
+    logging.info(f"Precompiled templates written to: {compiled_path}")
@@ -0,0 +1,79 @@
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from bson import json_util
+
+from .config import settings
+
+
+def iso_week_key(week_start: datetime) -> str:
+    """Cache key for the week starting on `week_start` (a Monday), e.g. '2025-W39'."""
+    year, week, _ = week_start.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class MongoWeekCache:
+    """Computed weekly delay stats for closed weeks, stored in the weeklyDelayStats collection by ISO week."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get_many(self, keys: list) -> dict:
+        return {doc["_id"]: doc["stats"] for doc in self.collection.find({"_id": {"$in": keys}})}
+
+    def put(self, key: str, week_start: datetime, stats: dict):
+        self.collection.replace_one({"_id": key}, {"_id": key, "weekStart": week_start, "stats": stats, "computedAt": datetime.utcnow()}, upsert=True)
+
+    def clear(self):
+        self.collection.delete_many({})
+
+
+class DiskWeekCache:
+    """Local-disk stand-in for MongoWeekCache: one JSON file per ISO week."""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get_many(self, keys: list) -> dict:
+        cached = {}
+        for key in keys:
+            path = self.directory / f"{key}.json"
+            if path.exists(): cached[key] = json_util.loads(path.read_text(encoding="utf-8"))["stats"]
+        return cached
+
+    def put(self, key: str, week_start: datetime, stats: dict):
+        path = self.directory / f"{key}.json"
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_text(json_util.dumps({"weekStart": week_start, "stats": stats, "computedAt": datetime.utcnow()}), encoding="utf-8")
+        temp_path.replace(path)
+
+    def clear(self):
+        for path in self.directory.glob("*.json"): path.unlink()
+
+
+class MemoryWeekCache:
+    """Per-process cache used when WEEKLY_STATS_CACHE=NONE."""
+
+    def __init__(self):
+        self._stats = {}
+
+    def get_many(self, keys: list) -> dict:
+        return {key: self._stats[key] for key in keys if key in self._stats}
+
+    def put(self, key: str, week_start: datetime, stats: dict):
+        self._stats[key] = stats
+
+    def clear(self):
+        self._stats.clear()
+
+
+def create_week_cache(db):
+    """Returns the weekly stats cache selected by WEEKLY_STATS_CACHE (MONGO, DISK or NONE)."""
+    if settings.WEEKLY_STATS_CACHE == "MONGO":
+        return MongoWeekCache(db.weeklyDelayStats)
+    if settings.WEEKLY_STATS_CACHE == "DISK":
+        return DiskWeekCache(settings.WEEKLY_STATS_CACHE_DIR)
+    logging.info("Weekly stats cache is in-memory only (WEEKLY_STATS_CACHE=NONE).")
+    return MemoryWeekCache()
@@ -0,0 +1,47 @@
+from collections import defaultdict
+
+from .config import settings
+
+# Sparkline canvas size in px; kept small so a dozen rows stay readable in an email client.
+SPARKLINE_WIDTH, SPARKLINE_HEIGHT = 120, 24
+DELAY_TYPE_LABELS = {"sign-out": "Sign-Out Delays", "authorization": "Authorization Delays", "teller-sign-out": "Teller Sign-Out Delays", "common-auth": "Common Authorization Delays"}
+
+
+def sparkline_points(values: list, width: int = SPARKLINE_WIDTH, height: int = SPARKLINE_HEIGHT) -> str:
+    """SVG polyline points for `values`, scaled to the canvas with a 2px margin; zero sits on the bottom edge."""
+    if not values: return ""
+    peak = max(values) or 1
+    step = (width - 4) / max(1, len(values) - 1)
+    return " ".join(f"{2 + i * step:.1f},{height - 2 - (value / peak) * (height - 4):.1f}" for i, value in enumerate(values))
+
+
+def _series(name: str, values: list) -> dict:
+    previous = values[-2] if len(values) > 1 else 0
+    points = sparkline_points(values)
+    end_x, end_y = points.rsplit(" ", 1)[-1].split(",")
+    return {"name": name, "counts": values, "total": sum(values), "latest": values[-1], "peak": max(values),
+            "direction": "up" if values[-1] > previous else "down" if values[-1] < previous else "neutral",
+            "points": points, "end_x": end_x, "end_y": end_y}
+
+
+def build_weekly_trends(history: list, top_groups: int = None) -> dict:
+    """
+    Turns [(week_start, {"byGroup": [...], "byType": [...]}), ...] into per-delay-type and per-group series for the
+    trend section of the weekly report. Only the `top_groups` groups with the most incidents over the window get a row.
+    """
+    top_groups = settings.WEEKLY_TREND_TOP_GROUPS if top_groups is None else top_groups
+    weeks = len(history)
+    by_group, by_type = defaultdict(lambda: [0] * weeks), defaultdict(lambda: [0] * weeks)
+    for i, (_, stats) in enumerate(history):
+        for item in stats.get("byGroup", []): by_group[item["_id"]][i] += item["totalDelays"]
+        for item in stats.get("byType", []): by_type[item["_id"]][i] += item["totalDelays"]
+    totals = [sum(item["totalDelays"] for item in stats.get("byGroup", [])) for _, stats in history]
+    groups = sorted(by_group.items(), key=lambda kv: (-sum(kv[1]), kv[0]))[:top_groups]
+    return {
+        "weeks": weeks,
+        "firstWeek": history[0][0].strftime('%d-%b-%Y') if history else "",
+        "sparkline_width": SPARKLINE_WIDTH, "sparkline_height": SPARKLINE_HEIGHT,
+        "overall": _series("All Delay Incidents", totals),
+        "byType": [_series(DELAY_TYPE_LABELS.get(delay_type, delay_type), values) for delay_type, values in sorted(by_type.items())],
+        "byGroup": [_series(name, values) for name, values in groups],
+    }
@@ -16,9 +16,11 @@ def main():
     logging.info("--- Starting Weekly EOD Summary Report Script ---")
     logging.info(f"Email mode: {settings.EMAIL_MODE}")
 
+    data_manager = email_service = None
     try:
         data_manager = DataManager()
-        email_service = EmailService()
+        # Only this script's own outbox messages are retried here; their notifications are logged once delivered.
+        email_service = EmailService(outbox=data_manager.get_outbox("weekly_report"), on_delivered=data_manager.log_notification)
 
         logging.info("Executing task: Weekly Summary Report")
         run_weekly_report(data_manager, email_service)
@@ -28,6 +30,9 @@ def main():
     except Exception as e:
         logging.critical(f"A critical error occurred during the weekly report run: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        if email_service: email_service.close()
+        if data_manager: data_manager.flush_notifications()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file